@@ -0,0 +1,173 @@
+"""Замеры скорости и памяти реализаций доски goboard_fast (BOARD_TYPES).
+
+Все реализации проигрывают одну и ту же случайную партию:
+    python bench_goboard.py --size 19 --moves 200
+"""
+import argparse
+import copy
+import random
+import time
+import tracemalloc
+
+from dlgo.goboard_fast import BOARD_TYPES, GameState, Move
+
+
+def random_game(size, num_moves, seed):
+    '''Ходы камнем случайной партии (без пасов)'''
+    rng = random.Random(seed)
+    game = GameState.new_game(size)
+    moves = []
+    while len(moves) < num_moves:
+        candidates = game.sensible_moves()
+        if not candidates:
+            break
+        move = rng.choice(candidates)
+        moves.append(move)
+        game = game.apply_move(move)
+    return moves
+
+
+def best_times(funcs, repeat):
+    '''Лучшее время из repeat запусков каждой функции.
+
+    Запуски разных функций чередуются, чтобы фоновая нагрузка сказывалась
+    на всех замерах одинаково.
+    '''
+    best = [None] * len(funcs)
+    for _ in range(repeat):
+        for i, func in enumerate(funcs):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return best
+
+
+def play_states(size, board_type, moves):
+    game = GameState.new_game(size, board_type)
+    states = [game]
+    for move in moves:
+        game = game.apply_move(move)
+        states.append(game)
+    return states
+
+
+def bench_place_stone(size, board_type, moves):
+    def run():
+        board = GameState.new_game(size, board_type).board
+        player = GameState.new_game(size).next_player
+        for move in moves:
+            board.place_stone(player, move.point)
+            player = player.other
+    return run
+
+
+def bench_apply_move(size, board_type, moves):
+    def run():
+        play_states(size, board_type, moves)
+    return run
+
+
+def bench_play_undo(size, board_type, moves):
+    states = play_states(size, board_type, moves)
+
+    def run():
+        for state, move in zip(states, moves):
+            state.play(move).undo()
+    return run
+
+
+def bench_copy(size, board_type, moves):
+    boards = [state.board for state in play_states(size, board_type, moves)]
+
+    def run():
+        for board in boards:
+            copy.deepcopy(board)
+    return run
+
+
+def bench_legal_moves(size, board_type, moves):
+    '''Ход и затем legal_moves(), как при раскрытии узла дерева поиска'''
+    def run():
+        game = GameState.new_game(size, board_type)
+        for move in moves:
+            game = game.apply_move(move)
+            game.legal_moves()
+    return run
+
+
+def rollout(game, rng, make_move):
+    '''Случайная партия до конца, как у RandomBot; make_move - apply_move или play'''
+    start = game
+    while not game.is_over():
+        candidates = game.sensible_moves()
+        move = rng.choice(candidates) if candidates else Move.pass_turn()
+        game = make_move(game, move)
+    game.winner()
+    if make_move is GameState.play:
+        while game is not start:
+            game = game.undo()
+
+
+def bench_rollouts(size, board_type, games, make_move):
+    def run():
+        rng = random.Random(1)
+        game = GameState.new_game(size, board_type)
+        for _ in range(games):
+            rollout(game, rng, make_move)
+    return run
+
+
+def state_memory(size, board_type, moves):
+    '''Байт на состояние партии, созданное apply_move'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = play_states(size, board_type, moves)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(states)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=19)
+    parser.add_argument('--moves', type=int, default=200)
+    parser.add_argument('--rollout-size', type=int, default=9)
+    parser.add_argument('--rollouts', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-types', nargs='*', default=sorted(BOARD_TYPES))
+    args = parser.parse_args()
+
+    moves = random_game(args.size, args.moves, args.seed)
+    per_move = [
+        ('place_stone', bench_place_stone),
+        ('apply_move', bench_apply_move),
+        ('play+undo', bench_play_undo),
+        ('deepcopy', bench_copy),
+        ('apply+legal_moves', bench_legal_moves),
+    ]
+    print('%dx%d, %d moves; us per move' % (args.size, args.size, len(moves)))
+    print('%-18s' % '' + ''.join('%12s' % bt for bt in args.board_types))
+    funcs = [bench(args.size, board_type, moves)
+             for _, bench in per_move for board_type in args.board_types]
+    times = iter(best_times(funcs, args.repeat))
+    for name, _ in per_move:
+        row = [next(times) / len(moves) * 1e6 for _ in args.board_types]
+        print('%-18s' % name + ''.join('%12.1f' % value for value in row))
+
+    row = [state_memory(args.size, board_type, moves) for board_type in args.board_types]
+    print('%-18s' % 'bytes per state' + ''.join('%12.0f' % value for value in row))
+
+    print('%dx%d random rollouts; ms per game' % (args.rollout_size, args.rollout_size))
+    rollouts = (('apply_move', GameState.apply_move), ('play/undo', GameState.play))
+    funcs = [bench_rollouts(args.rollout_size, board_type, args.rollouts, make_move)
+             for _, make_move in rollouts for board_type in args.board_types]
+    times = iter(best_times(funcs, max(1, args.repeat // 5)))
+    for name, _ in rollouts:
+        row = [next(times) / args.rollouts * 1e3 for _ in args.board_types]
+        print('%-18s' % name + ''.join('%12.1f' % value for value in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from .base import *
+from .budget import *
 from .naive import *
 from .pg import *
 from .predict import *
@@ -1,6 +1,8 @@
 import numpy as np
 from dlgo.agent.base import Agent
+from dlgo.agent.budget import SearchBudget
 from dlgo.goboard_fast import Move
+from dlgo.mcts.transposition import position_key
 from dlgo import kerasutil
 import operator
 
@@ -49,8 +51,25 @@ class AlphaGoNode:
 class AlphaGoMCTS(Agent):
     def __init__(self, policy_agent, fast_policy_agent, value_agent,
                  lambda_value=0.5, num_simulations=1000,
-                 depth=50, rollout_limit=100):
-        """Инициализация игрового агента AlphaGoMCTS."""
+                 depth=50, rollout_limit=100, move_time_ms=None, early_stop=False,
+                 transpositions=None):
+        """Инициализация игрового агента AlphaGoMCTS.
+
+        move_time_ms - время на ход в миллисекундах, проверяется между
+        симуляциями; num_simulations в этом случае - жесткий предел числа
+        симуляций (None - без предела).
+
+        early_stop - остановить поиск, когда самый посещаемый ход корня уже
+        не может быть догнан за оставшиеся симуляции (см. SearchBudget).
+        Бюджет последнего поиска с числом симуляций и сэкономленных
+        симуляций хранится в last_budget.
+
+        transpositions - таблица транспозиций (dlgo.mcts.transposition):
+        вероятности сильной политики и комбинированная оценка позиции
+        кэшируются по ключу позиции, так что позиция, встреченная снова
+        (другим порядком ходов или на следующем ходу), сетями не
+        пересчитывается.
+        """
         self.policy = policy_agent
         self.rollout_policy = fast_policy_agent
         self.value = value_agent
@@ -59,6 +78,10 @@ class AlphaGoMCTS(Agent):
         self.num_simulations = num_simulations
         self.depth = depth
         self.rollout_limit = rollout_limit
+        self.move_time_ms = move_time_ms
+        self.early_stop = early_stop
+        self.last_budget = None
+        self.transpositions = transpositions
         self.root = AlphaGoNode()
 
     def select_move(self, game_state):
@@ -66,33 +89,49 @@ class AlphaGoMCTS(Agent):
 
         ## Основной метод алгоритма поиска по дереву в системе AlphaGo
 
-        #симуляция заданного количества игр из текущего игрового состояния
-        for simulation in range(self.num_simulations):
+        #симуляция заданного количества игр (или игр за заданное время)
+        #из текущего игрового состояния
+        root_visits = None
+        if self.early_stop:
+            root_visits = lambda: [child.visit_count for child in self.root.children.values()]
+        #за одну симуляцию посещения узлов пути обновляются на каждом шаге спуска
+        budget = SearchBudget(self.move_time_ms, self.num_simulations, root_visits,
+                              self.depth)
+        self.last_budget = budget
+        while budget.next_round():
             current_state = game_state
             node = self.root
-            #совершение ходов вплоть до достижения указанной глубины
-            for depth in range(self.depth):
-                #если текущий узел не имеет дочерних элементов...
-                if not node.children:
-                    if current_state.is_over():
-                        break
-                    #...добавьте их, используя вероятности, предоставленные сильной сетью политики
-                    moves, probabilities = self.policy_probabilities(current_state)
-                    node.expand_children(moves, probabilities)
-
-                #если узел имеет дочерние элементы, вы можете выбрать один из них и совершить соответствующий ход
-                move, node = node.select_child()
-                current_state = current_state.apply_move(move)
-
-                #вычисление выхода сети ценности и результата развертывания быстрой сети политики
-                value = self.value.predict(current_state)
-                rollout = self.policy_rollout(current_state)
-
-                #определение значения комбинированной функции ценности
-                weighted_value = (1 - self.lambda_value) * value + self.lambda_value * rollout
-
-                #обновление значений этого узла при подъеме вверх по дереву
-                node.update_values(weighted_value)
+            #ходы спуска делаются через play() и отменяются в конце симуляции,
+            #поэтому доска не копируется на каждом шаге (состояния без play(),
+            #как в dlgo.goboard, копируются через apply_move)
+            undoable = hasattr(game_state, 'undo')
+            try:
+                #совершение ходов вплоть до достижения указанной глубины
+                for depth in range(self.depth):
+                    #если текущий узел не имеет дочерних элементов...
+                    if not node.children:
+                        if current_state.is_over():
+                            break
+                        #...добавьте их, используя вероятности, предоставленные сильной сетью политики
+                        moves, probabilities = self.cached_evaluation(
+                            'policy', current_state, self.policy_probabilities)
+                        node.expand_children(moves, probabilities)
+
+                    #если узел имеет дочерние элементы, вы можете выбрать один из них и совершить соответствующий ход
+                    move, node = node.select_child()
+                    if undoable:
+                        current_state = current_state.play(move)
+                    else:
+                        current_state = current_state.apply_move(move)
+
+                    weighted_value = self.cached_evaluation(
+                        'value', current_state, self.weighted_value)
+
+                    #обновление значений этого узла при подъеме вверх по дереву
+                    node.update_values(weighted_value)
+            finally:
+                while undoable and current_state is not game_state:
+                    current_state = current_state.undo()
 
         ## Выбор наиболее посещаемого узла и обновление корневого узла дерева
 
@@ -112,6 +151,26 @@ class AlphaGoMCTS(Agent):
                       "рассмотрите возможность сериализации трех " +
                       "базовых нейронных сетей вместо этого.")
 
+    def weighted_value(self, game_state):
+        """Комбинированная оценка позиции сетью ценности и развертыванием."""
+        #вычисление выхода сети ценности и результата развертывания быстрой сети политики
+        value = self.value.predict(game_state)
+        rollout = self.policy_rollout(game_state)
+
+        #определение значения комбинированной функции ценности
+        return (1 - self.lambda_value) * value + self.lambda_value * rollout
+
+    def cached_evaluation(self, kind, game_state, evaluate):
+        """evaluate(game_state) с кэшем в таблице транспозиций по ключу (kind, позиция)."""
+        if self.transpositions is None:
+            return evaluate(game_state)
+        key = (kind, position_key(game_state))
+        result = self.transpositions.get(key)
+        if result is None:
+            result = evaluate(game_state)
+            self.transpositions.put(key, result)
+        return result
+
     def policy_probabilities(self, game_state):
         """Вычисление нормализованныех значений сильной сети политики для допустимых ходов.
         Этот метод возвращает как допустимые ходы, так и соответствующие им нормальзованные
@@ -134,21 +193,38 @@ class AlphaGoMCTS(Agent):
         значения 1, если победил игрок, обладающий правом следующего хода, -1, если
         победил другой игрок, и 0, если не был достигнут ни один из результатов.
         """
-        for step in range(self.rollout_limit):
-            if game_state.is_over():
-                break
-            move_probabilities = self.rollout_policy.predict(game_state)
-            encoder = self.rollout_policy.encoder
-            valid_moves = [m for idx, m in enumerate(move_probabilities) if Move(encoder.decode_point_index(idx)) in game_state.legal_moves()]
-            max_index, max_value = max(enumerate(valid_moves), key=operator.itemgetter(1))
-            max_point = encoder.decode_point_index(max_index)
-            greedy_move = Move(max_point)
-            if greedy_move in game_state.legal_moves():
-                game_state = game_state.apply_move(greedy_move)
-
-        next_player = game_state.next_player
-        winner = game_state.winner()
-        if winner is not None:
-            return 1 if winner == next_player else -1
-        else:
-            return 0
+        start_state = game_state
+        undoable = hasattr(game_state, 'undo')
+        try:
+            for step in range(self.rollout_limit):
+                if game_state.is_over():
+                    break
+                move_probabilities = self.rollout_policy.predict(game_state)
+                encoder = self.rollout_policy.encoder
+                #допустимые точки считаются один раз на позицию (по точкам, а не
+                #по ходам: у dlgo.goboard свой класс Move), а ходы берутся из
+                #общей таблицы (Move.play не создает новых объектов)
+                legal_points = set(move.point for move in game_state.legal_moves()
+                                   if move.is_play)
+                valid_moves = [
+                    (p, Move.play(encoder.decode_point_index(idx)))
+                    for idx, p in enumerate(move_probabilities)]
+                valid_moves = [(p, m) for p, m in valid_moves if m.point in legal_points]
+                if not valid_moves:
+                    break
+                max_value, greedy_move = max(valid_moves, key=operator.itemgetter(0))
+                if undoable:
+                    #ход без копирования доски, отменяется в finally
+                    game_state = game_state.play(greedy_move)
+                else:
+                    game_state = game_state.apply_move(greedy_move)
+
+            next_player = game_state.next_player
+            winner = game_state.winner()
+            if winner is not None:
+                return 1 if winner == next_player else -1
+            else:
+                return 0
+        finally:
+            while undoable and game_state is not start_state:
+                game_state = game_state.undo()
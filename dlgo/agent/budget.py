@@ -0,0 +1,97 @@
+"""Бюджет поиска по дереву: время на ход и/или число раундов"""
+import math
+import time
+
+import numpy as np
+
+__all__ = [
+    'SearchBudget',
+]
+
+
+class SearchBudget:
+    '''Ограничение одного поиска, проверяемое между раундами.
+
+    move_time_ms - время на ход в миллисекундах, max_rounds - жесткий
+    предел числа раундов (симуляций); None снимает соответствующее
+    ограничение, но хотя бы одно из них должно быть задано. Первый раунд
+    выполняется всегда, чтобы у корня был хотя бы один ход.
+
+    root_visits - функция без аргументов, возвращающая счетчики посещений
+    ходов корня; если она задана, поиск останавливается раньше, когда
+    лидер по посещениям опережает второй ход больше, чем на число
+    оставшихся раундов, умноженное на visits_per_round - наибольший прирост
+    счетчика одного хода за раунд. При ограничении по времени оставшиеся раунды
+    оцениваются по средней скорости уже сделанных. Сколько раундов
+    сэкономлено, записывается в rounds_saved.
+
+    rounds_in_flight - функция без аргументов, возвращающая число начатых, но
+    еще не обновивших статистику раундов (параллельный и пакетный поиск):
+    root_visits в этом случае должна возвращать только законченные
+    посещения, а незаконченные раунды считаются оставшимися.
+
+    Использование:
+        budget = SearchBudget(move_time_ms, max_rounds)
+        while budget.next_round():
+            ...
+    '''
+
+    def __init__(self, move_time_ms=None, max_rounds=None, root_visits=None,
+                 visits_per_round=1, rounds_in_flight=None):
+        if move_time_ms is None and max_rounds is None:
+            raise ValueError("Search budget needs move_time_ms or max_rounds")
+        self.move_time_ms = move_time_ms
+        self.max_rounds = max_rounds
+        self.root_visits = root_visits
+        self.visits_per_round = visits_per_round
+        self.rounds_in_flight = rounds_in_flight
+        self.rounds = 0
+        self.rounds_saved = 0
+        self.start_time = time.perf_counter()
+        self.deadline = None
+        if move_time_ms is not None:
+            self.deadline = self.start_time + move_time_ms / 1000.0
+
+    def next_round(self):
+        '''Можно ли начать еще один раунд; если да, раунд засчитывается'''
+        if self.max_rounds is not None and self.rounds >= self.max_rounds:
+            return False
+        if self.deadline is not None and self.rounds > 0 and \
+                time.perf_counter() >= self.deadline:
+            return False
+        if self.root_visits is not None and self.rounds > 0 and self._leader_is_safe():
+            return False
+        self.rounds += 1
+        return True
+
+    def remaining_rounds(self):
+        '''Сколько раундов еще может быть сделано (для времени - оценка)'''
+        remaining = None
+        if self.max_rounds is not None:
+            remaining = self.max_rounds - self.rounds
+        if self.deadline is not None:
+            now = time.perf_counter()
+            round_time = (now - self.start_time) / max(self.rounds, 1)
+            by_time = int(math.ceil(max(self.deadline - now, 0.0) / max(round_time, 1e-9)))
+            remaining = by_time if remaining is None else min(remaining, by_time)
+        return remaining
+
+    def _leader_is_safe(self):
+        '''Лидер по посещениям корня уже не может быть догнан'''
+        visits = np.asarray(self.root_visits())
+        if len(visits) == 0:
+            return False
+        remaining = self.remaining_rounds()
+        if len(visits) == 1:
+            #выбирать не из чего
+            safe = True
+        else:
+            second, best = np.partition(visits, len(visits) - 2)[-2:]
+            catch_up = remaining
+            if self.rounds_in_flight is not None:
+                catch_up += self.rounds_in_flight()
+            safe = best - second > catch_up * self.visits_per_round
+        if safe:
+            self.rounds_saved = remaining
+            return True
+        return False
@@ -10,6 +10,12 @@ class RandomBot(Agent):
         """Случайным образом выбирается любой допустимый ход, в результате которого 
         не заполняется ни один из глаз собственных групп камней.
         """
+        if hasattr(game_state, 'sensible_moves'):
+            # goboard_fast: маски допустимых ходов ведет сама доска
+            moves = game_state.sensible_moves()
+            if not moves:
+                return Move.pass_turn()
+            return random.choice(moves)
         candidates = []
         for r in range(1, game_state.board.num_rows + 1):
             for c in range(1, game_state.board.num_cols + 1):
@@ -1,7 +1,7 @@
 from dlgo.encoders.base import Encoder
 from dlgo.encoders.utils import is_ladder_escape, is_ladder_capture
-from dlgo.gotypes import Point, Player
-from dlgo.goboard_fast import Move
+from dlgo.gotypes import Player
+from dlgo.goboard_fast import get_move_table
 from dlgo.agent.helpers import is_point_an_eye
 import numpy as np
 
@@ -75,15 +75,24 @@ class AlphaGoEncoder(Encoder):
         self.board_width, self.board_height = board_size
         self.use_player_plane = use_player_plane
         self.num_planes = 48 + use_player_plane
+        # точки и ходы доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(self.board_height, self.board_width)
 
     def name(self):
         return 'alphago'
 
     def encode(self, game_state):
         board_tensor = np.zeros((self.num_planes, self.board_height, self.board_width))
+
+        # Ходов с тех пор: плоскость min(возраст, 7) для каждого камня
+        ages = game_state.board.move_ages.ages()
+        rows, cols = np.nonzero(ages >= 0)
+        board_tensor[offset("turns_since") + np.minimum(ages[rows, cols], 7), rows, cols] = 1
+
         for r in range(self.board_height):
             for c in range(self.board_width):
-                point = Point(row=r + 1, col=c + 1)
+                move = self.move_table.moves[r * self.board_width + c]
+                point = move.point
 
                 go_string = game_state.board.get_go_string(point)
                 if go_string and go_string.color == game_state.next_player:
@@ -99,16 +108,10 @@ class AlphaGoEncoder(Encoder):
                 if not is_point_an_eye(game_state.board, point, game_state.next_player):
                     board_tensor[offset("sensibleness")][r][c] = 1
 
-                ages = min(game_state.board.move_ages.get(r, c), 8)
-                if ages > 0:
-                    print(ages)
-                    board_tensor[offset("turns_since") + ages][r][c] = 1
-
                 if game_state.board.get_go_string(point):
                     liberties = min(game_state.board.get_go_string(point).num_liberties, 8)
                     board_tensor[offset("liberties") + liberties][r][c] = 1
 
-                move = Move(point)
                 if game_state.is_valid_move(move):
                     new_state = game_state.apply_move(move)
                     liberties = min(new_state.board.get_go_string(point).num_liberties, 8)
@@ -158,9 +161,7 @@ class AlphaGoEncoder(Encoder):
         return self.board_width * (point.row - 1) + (point.col - 1)
 
     def decode_point_index(self, index):
-        row = index // self.board_width
-        col = index % self.board_width
-        return Point(row=row + 1, col=col + 1)
+        return self.move_table.points[index]
 
     def num_points(self):
         return self.board_width * self.board_height
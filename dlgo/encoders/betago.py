@@ -4,7 +4,7 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.goboard import Move, Point
+from dlgo.goboard_fast import get_move_table
 
 
 class BetaGoEncoder(Encoder):
@@ -19,6 +19,8 @@ class BetaGoEncoder(Encoder):
         # 3 - 5. камень противника с 1, 2, 3+ степенями свободы
         # 6. незаконные ходы из-за Ко.
         self.num_planes = 7
+        # точки и ходы доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(self.board_height, self.board_width)
 
     def name(self):
         return 'betago'
@@ -31,12 +33,11 @@ class BetaGoEncoder(Encoder):
         }
         for r in range(self.board_height):
             for c in range(self.board_width):
-                p = Point(row=r + 1, col=c + 1)
-                go_string = game_state.board.get_go_string(p)
+                move = self.move_table.moves[r * self.board_width + c]
+                go_string = game_state.board.get_go_string(move.point)
 
                 if go_string is None:
-                    if game_state.does_move_violate_ko(game_state.next_player,
-                                                       Move.play(p)):
+                    if game_state.does_move_violate_ko(game_state.next_player, move):
                         # кодирование ходов, запрещенных правилом Ко
                         board_tensor[6][r][c] = 1
                 else:
@@ -54,9 +55,7 @@ class BetaGoEncoder(Encoder):
 
     def decode_point_index(self, index):
         """Преобразует целочисленный индекс в точку на доске."""
-        row = index // self.board_width
-        col = index % self.board_width
-        return Point(row=row + 1, col=col + 1)
+        return self.move_table.points[index]
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -2,7 +2,7 @@ import numpy as np
 
 from dlgo.encoders.base import Encoder
 #from dlgo.goboard import Point
-from dlgo.gotypes import Point
+from dlgo.goboard_fast import get_move_table
 
 class OnePlaneEncoder(Encoder):
     '''Одноплоскостной кодировщик доски'''
@@ -10,6 +10,8 @@ class OnePlaneEncoder(Encoder):
     def __init__(self, board_size):
         self.board_width, self.board_height = board_size
         self.num_planes = 1
+        # точки доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(self.board_height, self.board_width)
     
     def name(self):
         #Ссылаемся на этот кодирощик, указав имя oneplane
@@ -25,7 +27,7 @@ class OnePlaneEncoder(Encoder):
         next_player = game_state.next_player
         for r in range(self.board_height):
             for c in range(self.board_width):
-                p = Point(row=r+1, col=c+1)
+                p = self.move_table.points[r * self.board_width + c]
                 go_string = game_state.board.get_go_string(p)
                 if go_string is None:
                     continue
@@ -41,9 +43,7 @@ class OnePlaneEncoder(Encoder):
     
     def decode_point_index(self, index):
         #Преобразуем целочисленный индекс в точку доски
-        row = index // self.board_width
-        col  = index % self.board_width
-        return Point(row=row+1, col=col+1)
+        return self.move_table.points[index]
     
     def num_points(self):
         return self.board_width * self.board_height
@@ -1,7 +1,7 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.goboard import Move, Point
+from dlgo.goboard_fast import get_move_table
 
 class SevenPlaneEncoder(Encoder):
     """Простой кодировщик состоящий из 7 плоскостей.
@@ -15,6 +15,8 @@ class SevenPlaneEncoder(Encoder):
     def __init__(self, board_size):
         self.board_width, self.board_height = board_size
         self.num_planes = 7
+        # точки и ходы доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(self.board_height, self.board_width)
 
     def name(self):
         return 'sevenplane'
@@ -25,10 +27,10 @@ class SevenPlaneEncoder(Encoder):
                       game_state.next_player.other: 3}
         for row in range(self.board_height):
             for col in range(self.board_width):
-                p = Point(row=row+1, col=col+1)
-                go_string = game_state.board.get_go_string(p)
+                move = self.move_table.moves[row * self.board_width + col]
+                go_string = game_state.board.get_go_string(move.point)
                 if go_string is None:
-                    if game_state.does_move_violate_ko(game_state.next_player, Move.play(p)):
+                    if game_state.does_move_violate_ko(game_state.next_player, move):
                         #кодирование ходов, запрещенных правилом Ко
                         board_tensor[6][row][col] = 1
                 else:
@@ -42,9 +44,7 @@ class SevenPlaneEncoder(Encoder):
         return self.board_width * (point.row-1) + (point.col-1)
 
     def decode_point_index(self, index):
-        row = index // self.board_width
-        col = index % self.board_width
-        return Point(row=row+1, col=col+1)
+        return self.move_table.points[index]
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -1,8 +1,8 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.goboard import Move
-from dlgo.gotypes import Player, Point
+from dlgo.goboard_fast import get_move_table
+from dlgo.gotypes import Player
 
 
 class SimpleEncoder(Encoder):
@@ -18,6 +18,8 @@ class SimpleEncoder(Encoder):
         # 9. следующими ходят белые
         # 10. зарезервировано для Ко
         self.num_planes = 11
+        # точки и ходы доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(self.board_height, self.board_width)
 
     def name(self):
         return 'simple'
@@ -30,12 +32,11 @@ class SimpleEncoder(Encoder):
             board_tensor[9] = 1
         for r in range(self.board_height):
             for c in range(self.board_width):
-                p = Point(row=r + 1, col=c + 1)
-                go_string = game_state.board.get_go_string(p)
+                move = self.move_table.moves[r * self.board_width + c]
+                go_string = game_state.board.get_go_string(move.point)
 
                 if go_string is None:
-                    if game_state.does_move_violate_ko(game_state.next_player,
-                                                       Move.play(p)):
+                    if game_state.does_move_violate_ko(game_state.next_player, move):
                         board_tensor[10][r][c] = 1
                 else:
                     liberty_plane = min(4, go_string.num_liberties) - 1
@@ -52,9 +53,7 @@ class SimpleEncoder(Encoder):
 
     def decode_point_index(self, index):
         """Преобразует целочисленный индекс в точку на доске."""
-        row = index // self.board_width
-        col = index % self.board_width
-        return Point(row=row + 1, col=col + 1)
+        return self.move_table.points[index]
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -1,8 +1,9 @@
 import copy
+import numpy as np
 from dlgo.gotypes import Player, Point
 from dlgo.scoring import compute_game_result
 from dlgo import zobrist
-from dlgo.utils import MoveAge
+from dlgo.utils import MoveAge, UndoRecord
 
 __all__ = [
     'Board',
@@ -12,6 +13,28 @@ __all__ = [
 
 neighbor_tables = {}
 corner_tables = {}
+point_tables = {}
+empty_move_masks = {}
+
+# Плоскости масок ходов (Board.legal_mask и др.): допустимый ход (пустая точка
+# без самозахвата, без учета Ко), допустимый ход, не заполняющий собственный
+# глаз, и ход, захватывающий камни противника. Для каждой плоскости по маске на
+# цвет: индекс цвета - player.value - 1.
+LEGAL = 0
+SENSIBLE = 1
+CAPTURE = 2
+
+# Фильтр истории позиций (GameState): целое число из HISTORY_FILTER_BITS бит,
+# в котором каждая ситуация (игрок, хэш) взводит два бита, выбранных по хэшу.
+HISTORY_FILTER_BITS = 2048
+
+
+def situation_bits(player, board_hash):
+    '''Биты ситуации (игрок, хэш) в фильтре истории'''
+    low = board_hash & 0x3ff
+    high = (board_hash >> 10) & 0x3ff
+    color = player.value - 1
+    return (1 << (2 * low + color)) | (1 << (2 * high + color))
 
 
 def init_neighbor_table(dim):
@@ -47,6 +70,15 @@ def init_corner_table(dim):
     corner_tables[dim] = new_table
 
 
+def init_point_table(dim):
+    '''Точки доски в порядке строк: индекс (row - 1) * cols + (col - 1)'''
+    rows, cols = dim
+    point_tables[dim] = [
+        Point(row=r, col=c)
+        for r in range(1, rows + 1)
+        for c in range(1, cols + 1)]
+
+
 class IllegalMoveError(Exception):
     pass
 
@@ -118,9 +150,29 @@ class Board():
             init_neighbor_table(dim)
         if dim not in corner_tables:
             init_corner_table(dim)
+        if dim not in point_tables:
+            init_point_table(dim)
         self.neighbor_table = neighbor_tables[dim]
         self.corner_table = corner_tables[dim]
+        self.point_table = point_tables[dim]
+        # Zobrist-коды: _codes[цвет][(row - 1) * num_cols + (col - 1)]
+        self._codes = zobrist.get_code_table(num_rows, num_cols)
         self.move_ages = MoveAge(self)
+        # стек отмены ходов, сделанных через play()
+        self._undo_stack = []
+        self._undo_record = None
+        # Маски ходов (см. LEGAL, SENSIBLE, CAPTURE) пересчитываются лениво:
+        # place_stone только запоминает в _stale точки вокруг поставленного и
+        # снятых камней, а пересчет делает первое чтение маски (_current_masks).
+        # None - маски не отслеживаются и при чтении строятся заново. Маски в
+        # виде bytes (неизменяемые) общие с копиями доски и копируются в
+        # bytearray при первом пересчете.
+        if dim not in empty_move_masks:
+            self._move_masks = bytearray(6 * num_rows * num_cols)
+            self._refresh_moves(self.point_table)
+            empty_move_masks[dim] = bytes(self._move_masks)
+        self._move_masks = empty_move_masks[dim]
+        self._stale = []
 
 
     def neighbors(self, point):
@@ -135,11 +187,17 @@ class Board():
         if self._grid.get(point) is not None:
             print('Illegal play on %s' % str(point))
         assert self._grid.get(point) is None
+        # точки, допустимость ходов в которых могла измениться (None, если
+        # маски ходов не отслеживаются)
+        dirty = None
+        if self._move_masks is not None:
+            dirty = [point]
+            dirty.extend(self.neighbor_table[point])
+            dirty.extend(self.corner_table[point])
         # 0. Examine the adjacent points.
         adjacent_same_color = []
         adjacent_opposite_color = []
         liberties = []
-        self.move_ages.increment_all()
         self.move_ages.add(point)
         for neighbor in self.neighbor_table[point]:
             # сначала исследуются непосредственные соседи конкретной точки
@@ -157,13 +215,19 @@ class Board():
         # 1. Объединение любых смежных цепочек камней одного цвета
         for same_color_string in adjacent_same_color:
             new_string = new_string.merged_with(same_color_string)
+        if self._undo_record is not None:
+            self._undo_record.replaced_strings.extend(adjacent_same_color)
+        grid = self._grid
         for new_string_point in new_string.stones:
-            self._grid[new_string_point] = new_string
-        # Remove empty-point hash code.
-        self._hash ^= zobrist.HASH_CODE[point, None]
-        # Add filled point hash code.
+            grid[new_string_point] = new_string
+        # на допустимость ходов влияет только то, находится ли цепочка в атари
+        if dirty is not None and (new_string.num_liberties == 1 or
+                                  any(s.num_liberties == 1 for s in adjacent_same_color)):
+            dirty.extend(new_string.liberties)
+        # Remove empty-point hash code, add filled point hash code.
         # Применение хэш-кода для данной точки и игрока
-        self._hash ^= zobrist.HASH_CODE[point, player]  # ^ - XOR
+        idx = (point.row - 1) * self.num_cols + (point.col - 1)
+        self._hash ^= self._codes[0][idx] ^ self._codes[player.value][idx]  # ^ - XOR
 
         # 2. Reduce liberties of any adjacent strings of the opposite
         #    color.
@@ -173,32 +237,215 @@ class Board():
             # Уменьшение количества степеней свободы соседних цепочек камней противоположного цвета
             replacement = other_color_string.without_liberty(point)
             if replacement.num_liberties:
-                self._replace_string(other_color_string.without_liberty(point))
+                self._replace_string(other_color_string, replacement)
+                if dirty is not None and replacement.num_liberties == 1:
+                    dirty.extend(replacement.liberties)
             else:
                 # Удаление с доски цепочек камней противоположного цвета с нулевой степенью свободы
-                self._remove_string(other_color_string)
-
-    def _replace_string(self, new_string):
-        """Обновление сетки доски"""
+                self._remove_string(other_color_string, dirty)
+
+        if dirty is not None:
+            self._mark_stale(dirty)
+        if self._undo_record is not None:
+            self._undo_record.dirty = dirty
+
+    def play(self, player, point):
+        '''Размещение камня с записью в стек отмены: ход можно отменить через undo()'''
+        record = UndoRecord(point, self._hash)
+        if not self._undo_stack:
+            self._save_masks(record)
+        self._undo_record = record
+        try:
+            self.place_stone(player, point)
+        finally:
+            self._undo_record = None
+        self._undo_stack.append(record)
+
+    def undo(self):
+        '''Отмена последнего хода, сделанного через play()'''
+        record = self._undo_stack.pop()
+        grid = self._grid
+        # каждая точка получает цепочку, которую первой заменил ход
+        for string in reversed(record.replaced_strings):
+            for point in string.stones:
+                grid[point] = string
+        grid[record.point] = None
+        self._hash = record.board_hash
+        for point, move_number in record.captured:
+            self.move_ages.restore(point, move_number)
+        self.move_ages.remove_last(record.point)
+        self._undo_stale(record)
+
+    def _replace_string(self, old_string, new_string):
+        """Обновление сетки доски; при ходе через play() прежняя цепочка сохраняется для отмены"""
+        if self._undo_record is not None:
+            self._undo_record.replaced_strings.append(old_string)
+        grid = self._grid
         for point in new_string.stones:
-            self._grid[point] = new_string
-
-    def _remove_string(self, string):
-        """Удаление камней"""
+            grid[point] = new_string
+
+    def _remove_string(self, string, dirty):
+        """Удаление камней; затронутые точки добавляются в dirty (если не None)"""
+        color = string.color.value
+        record = self._undo_record
+        if record is not None:
+            record.replaced_strings.append(string)
         for point in string.stones:
-            self.move_ages.reset_age(point)
+            move_number = self.move_ages.reset_age(point)
+            if record is not None:
+                record.captured.append((point, move_number))
+            if dirty is not None:
+                dirty.append(point)
+                dirty.extend(self.neighbor_table[point])
+                dirty.extend(self.corner_table[point])
             #Удаление цепочки может привести к увеличению степеней свободы других цепочек
             for neighbor in self.neighbor_table[point]:
                 neighbor_string = self._grid.get(neighbor)
                 if neighbor_string is None:
                     continue
                 if neighbor_string is not string:
-                    self._replace_string(neighbor_string.with_liberty(point))
+                    if dirty is not None and neighbor_string.num_liberties == 1:
+                        # цепочка выходит из атари
+                        dirty.extend(neighbor_string.liberties)
+                    self._replace_string(neighbor_string, neighbor_string.with_liberty(point))
             self._grid[point] = None
-            #Отменяем применение хеш-значения для этого хода
-            self._hash ^= zobrist.HASH_CODE[point, string.color]
+            #Отменяем применение хеш-значения для этого хода и
             # Add empty point hash code.
-            self._hash ^= zobrist.HASH_CODE[point, None]
+            idx = (point.row - 1) * self.num_cols + (point.col - 1)
+            self._hash ^= self._codes[color][idx] ^ self._codes[0][idx]
+
+    def _mark_stale(self, points):
+        """Запоминает точки, маски в которых устарели"""
+        stale = self._stale
+        stale.extend(points)
+        if len(stale) > self.num_rows * self.num_cols:
+            # пересчет всей доски при чтении обойдется не дороже
+            self._move_masks = None
+            self._stale = []
+
+    def _save_masks(self, record):
+        """Запоминает маски перед первым ходом стека отмены.
+
+        Отмена всей серии ходов (развертывание) обычно устаревает больше
+        точек, чем есть на доске, и без сохраненных масок следующее чтение
+        пересчитывало бы всю доску.
+        """
+        if self._move_masks is None:
+            return
+        if isinstance(self._move_masks, bytearray):
+            self._move_masks = bytes(self._move_masks)
+        record.masks = (self._move_masks, list(self._stale))
+
+    def _undo_stale(self, record):
+        """Маски после отмены хода: устарели те же точки, что и при ходе"""
+        if record.masks is not None:
+            self._move_masks, self._stale = record.masks
+            return
+        if self._move_masks is None:
+            return
+        if record.dirty is None:
+            # ход сделан, когда маски не отслеживались
+            self._move_masks = None
+            self._stale = []
+        else:
+            self._mark_stale(record.dirty)
+
+    def _current_masks(self):
+        """Актуальные маски ходов: пересчет устаревших точек или всей доски"""
+        if self._move_masks is None:
+            self._move_masks = bytearray(6 * self.num_rows * self.num_cols)
+            self._stale = []
+            self._refresh_moves(self.point_table)
+        elif self._stale:
+            if not isinstance(self._move_masks, bytearray):
+                self._move_masks = bytearray(self._move_masks)
+            stale = self._stale
+            self._stale = []
+            self._refresh_moves(stale)
+        return self._move_masks
+
+    def _refresh_moves(self, points):
+        """Пересчет масок ходов в указанных точках для обоих цветов"""
+        masks = self._move_masks
+        plane = self.num_rows * self.num_cols
+        black, white = 0, plane
+        grid = self._grid
+        for point in set(points):
+            idx = (point.row - 1) * self.num_cols + (point.col - 1)
+            if grid.get(point) is not None:
+                for offset in range(0, 6 * plane, plane):
+                    masks[offset + idx] = 0
+                continue
+            # один проход по соседям сразу для обоих цветов
+            has_liberty = False
+            black_safe = white_safe = False
+            black_captures = white_captures = False
+            all_black = all_white = True
+            for neighbor in self.neighbor_table[point]:
+                neighbor_string = grid.get(neighbor)
+                if neighbor_string is None:
+                    has_liberty = True
+                    all_black = all_white = False
+                elif neighbor_string.color == Player.black:
+                    all_white = False
+                    if neighbor_string.num_liberties == 1:
+                        white_captures = True
+                    else:
+                        black_safe = True
+                else:
+                    all_black = False
+                    if neighbor_string.num_liberties == 1:
+                        black_captures = True
+                    else:
+                        white_safe = True
+            black_legal = has_liberty or black_safe or black_captures
+            white_legal = has_liberty or white_safe or white_captures
+            masks[LEGAL * 2 * plane + black + idx] = black_legal
+            masks[LEGAL * 2 * plane + white + idx] = white_legal
+            masks[SENSIBLE * 2 * plane + black + idx] = black_legal and \
+                not (all_black and self._is_eye(point, Player.black))
+            masks[SENSIBLE * 2 * plane + white + idx] = white_legal and \
+                not (all_white and self._is_eye(point, Player.white))
+            masks[CAPTURE * 2 * plane + black + idx] = black_captures
+            masks[CAPTURE * 2 * plane + white + idx] = white_captures
+
+    def _is_eye(self, point, player):
+        """Проверка углов для глаза (все соседи уже камни player), как в is_point_an_eye"""
+        friendly_corners = 0
+        off_board_corners = 4 - len(self.corner_table[point])
+        for corner in self.corner_table[point]:
+            if self.get(corner) == player:
+                friendly_corners += 1
+        if off_board_corners > 0:
+            return off_board_corners + friendly_corners == 4
+        return friendly_corners >= 3
+
+    def _mask(self, kind, player):
+        plane = self.num_rows * self.num_cols
+        offset = (kind * 2 + player.value - 1) * plane
+        return np.frombuffer(self._current_masks(), dtype=np.bool_,
+                             count=plane, offset=offset).reshape(
+                                 (self.num_rows, self.num_cols))
+
+    def legal_mask(self, player, sensible=False):
+        """Маска (num_rows, num_cols) допустимых ходов player без учета Ко.
+
+        При sensible=True исключаются ходы, заполняющие собственные глаза.
+        """
+        return self._mask(SENSIBLE if sensible else LEGAL, player).copy()
+
+    def capture_mask(self, player):
+        """Маска ходов player, захватывающих камни противника"""
+        return self._mask(CAPTURE, player).copy()
+
+    def legal_indices(self, player, sensible=False):
+        """Индексы (row - 1) * num_cols + (col - 1) допустимых ходов player (без учета Ко)"""
+        return np.flatnonzero(self._mask(SENSIBLE if sensible else LEGAL, player))
+
+    def legal_points(self, player, sensible=False):
+        """Список точек допустимых ходов player (без учета Ко)"""
+        points = self.point_table
+        return [points[idx] for idx in self.legal_indices(player, sensible)]
 
     def is_self_capture(self, player, point):
         friendly_strings = []
@@ -231,6 +478,30 @@ class Board():
                     return True
         return False
 
+    def hash_after_move(self, player, point):
+        '''Zobrist-хэш доски после хода player в point, без изменения доски.
+
+        Хэш вычисляется из текущего: точка становится занятой, а камни цепочек
+        противника с единственной степенью свободы (она и есть point) снимаются.
+        '''
+        codes = self._codes
+        num_cols = self.num_cols
+        idx = (point.row - 1) * num_cols + (point.col - 1)
+        new_hash = self._hash ^ codes[0][idx] ^ codes[player.value][idx]
+        captured = []
+        for neighbor in self.neighbor_table[point]:
+            neighbor_string = self._grid.get(neighbor)
+            if neighbor_string is None or neighbor_string.color == player:
+                continue
+            if neighbor_string.num_liberties == 1 and \
+                    neighbor_string not in captured:
+                captured.append(neighbor_string)
+                color = neighbor_string.color.value
+                for stone in neighbor_string.stones:
+                    idx = (stone.row - 1) * num_cols + (stone.col - 1)
+                    new_hash ^= codes[color][idx] ^ codes[0][idx]
+        return new_hash
+
     def is_on_grid(self, point):
         '''Проверка на размещение на доске'''
         return 1 <= point.row <= self.num_rows and \
@@ -257,11 +528,20 @@ class Board():
             self._hash() == other._hash()
 
     def __deepcopy__(self, memodict={}):
-        copied = Board(self.num_rows, self.num_cols)
+        if isinstance(self._move_masks, bytearray):
+            # маски становятся общими для доски и ее копий
+            self._move_masks = bytes(self._move_masks)
+        # копия не вызывает конструктор: таблицы соседей и кодов общие, а
+        # сетка и возраст камней сразу копируются из оригинала
+        copied = self.__class__.__new__(self.__class__)
+        copied.__dict__.update(self.__dict__)
         # Can do a shallow copy b/c the dictionary maps tuples
         # (immutable) to GoStrings (also immutable)
         copied._grid = copy.copy(self._grid)
-        copied._hash = self._hash
+        copied._stale = list(self._stale)
+        copied.move_ages = self.move_ages.copy()
+        copied._undo_stack = []
+        copied._undo_record = None
         return copied
 
     def zobrist_hash(self):
@@ -269,32 +549,157 @@ class Board():
         return self._hash
 
 
+class ChunkedGrid():
+    '''Сетка доски по строкам с копированием при записи.
+
+    Каждая строка - отдельный словарь точка -> цепочка. Копия сетки делит
+    строки с оригиналом, а строка копируется только при первой записи в нее,
+    так что ход копирует лишь строки, которых касаются поставленный и снятые
+    камни и цепочки с изменившимися степенями свободы.
+    '''
+
+    def __init__(self, num_rows):
+        self._rows = [{} for _ in range(num_rows)]
+        # строки, которыми владеет только эта сетка
+        self._owned = [True] * num_rows
+
+    def get(self, point, default=None):
+        row = point.row - 1
+        if 0 <= row < len(self._rows):
+            return self._rows[row].get(point, default)
+        return default
+
+    def __setitem__(self, point, string):
+        row = point.row - 1
+        if not self._owned[row]:
+            self._rows[row] = dict(self._rows[row])
+            self._owned[row] = True
+        self._rows[row][point] = string
+
+    def __copy__(self):
+        copied = ChunkedGrid.__new__(ChunkedGrid)
+        copied._rows = list(self._rows)
+        # после копирования все строки общие - записывать в них нельзя ни оригиналу, ни копии
+        self._owned = [False] * len(self._rows)
+        copied._owned = [False] * len(self._rows)
+        return copied
+
+
+class ChunkedMoveAge():
+    '''MoveAge по строкам с копированием при записи (как ChunkedGrid).
+
+    Интерфейс тот же, что у MoveAge; строки - списки номеров ходов, и копия
+    делит с оригиналом все строки, в которые после копирования не писали.
+    '''
+
+    def __init__(self, board):
+        self._rows = [[-1] * board.num_cols for _ in range(board.num_rows)]
+        self._owned = [True] * board.num_rows
+        self.num_moves = 0
+
+    def _set(self, row, col, move_number):
+        if not self._owned[row]:
+            self._rows[row] = list(self._rows[row])
+            self._owned[row] = True
+        self._rows[row][col] = move_number
+
+    def get(self, row, col):
+        move_number = self._rows[row][col]
+        if move_number < 0:
+            return -1
+        return self.num_moves - 1 - move_number
+
+    def ages(self):
+        move_numbers = np.array(self._rows, dtype=np.int64)
+        return np.where(move_numbers < 0, -1, self.num_moves - 1 - move_numbers)
+
+    def reset_age(self, point):
+        move_number = self._rows[point.row - 1][point.col - 1]
+        self._set(point.row - 1, point.col - 1, -1)
+        return move_number
+
+    def restore(self, point, move_number):
+        self._set(point.row - 1, point.col - 1, move_number)
+
+    def add(self, point):
+        self._set(point.row - 1, point.col - 1, self.num_moves)
+        self.num_moves += 1
+
+    def remove_last(self, point):
+        self._set(point.row - 1, point.col - 1, -1)
+        self.num_moves -= 1
+
+    def copy(self):
+        copied = ChunkedMoveAge.__new__(ChunkedMoveAge)
+        copied._rows = list(self._rows)
+        self._owned = [False] * len(self._rows)
+        copied._owned = [False] * len(self._rows)
+        copied.num_moves = self.num_moves
+        return copied
+
+
+class ChunkedBoard(Board):
+    '''Board с сеткой ChunkedGrid и возрастом камней ChunkedMoveAge: копия доски
+    (apply_move) делит с родителем все строки, которые ход не изменил, а маски
+    ходов, как и у Board, общие до первого пересчета.
+
+    Состояние партии занимает меньше памяти, чем с Board, но каждый ход
+    дороже (см. bench_goboard.py); доска нужна, когда хранится много
+    состояний (дерево поиска), а не для быстрых развертываний.
+    '''
+
+    def __init__(self, num_rows, num_cols):
+        Board.__init__(self, num_rows, num_cols)
+        self._grid = ChunkedGrid(num_rows)
+        self.move_ages = ChunkedMoveAge(self)
+
+
+# Реализации доски, доступные при создании игры (GameState.new_game)
+BOARD_TYPES = {
+    'dict': Board,
+    'cow': ChunkedBoard,
+}
+
+
 class Move():
     """Любое действие, которое игрок может выполнить в свой ход.
 
     Будет установлено ровно одно из значений is_play, is_pass, is_resign.
+    Ходы неизменяемые: Move.play возвращает один и тот же объект для точки,
+    пас и сдача - единственные экземпляры. Номер хода зависит от ширины
+    доски, поэтому хранится не в ходе, а в MoveTable ее размера.
     """
+    __slots__ = ('point', 'is_play', 'is_pass', 'is_resign', '_hash')
+
     def __init__(self, point=None, is_pass=False, is_resign=False):
         assert (point is not None) ^ is_pass ^ is_resign
         self.point = point
         self.is_play = (self.point is not None)
         self.is_pass = is_pass
         self.is_resign = is_resign
+        if self.is_play:
+            self._hash = hash(point)
+        else:
+            self._hash = -2 if is_pass else -3
 
     @classmethod
     def play(cls, point):
         """Ход, который помещает камень на доску."""
-        return Move(point=point)
+        move = play_moves.get(point)
+        if move is None:
+            move = Move(point=point)
+            play_moves[point] = move
+        return move
 
     @classmethod
     def pass_turn(cls):
         '''Ход предполагает пропуск хода'''
-        return Move(is_pass=True)
+        return PASS_MOVE
 
     @classmethod
     def resign(cls):
         '''Ход предполагает выход из игры'''
-        return Move(is_resign=True)
+        return RESIGN_MOVE
 
     def __str__(self):
         if self.is_pass:
@@ -304,22 +709,66 @@ class Move():
         return '(r %d, c %d)' % (self.point.row, self.point.col)
 
     def __hash__(self):
-        return hash((
-            self.is_play,
-            self.is_pass,
-            self.is_resign,
-            self.point))
+        return self._hash
 
     def  __eq__(self, other):
+        if self is other:
+            return True
         return (
-            self.is_play,
-            self.is_pass,
-            self.is_resign,
-            self.point) == (
-            other.is_play,
-            other.is_pass,
-            other.is_resign,
-            other.point)
+            self.point == other.point and
+            self.is_pass == other.is_pass and
+            self.is_resign == other.is_resign)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # после передачи в другой процесс ход снова берется из общих экземпляров
+        if self.is_pass:
+            return (Move.pass_turn, ())
+        if self.is_resign:
+            return (Move.resign, ())
+        return (Move.play, (self.point,))
+
+
+# Move.play: точка -> ход
+play_moves = {}
+PASS_MOVE = Move(is_pass=True)
+RESIGN_MOVE = Move(is_resign=True)
+
+move_tables = {}
+
+
+class MoveTable():
+    '''Точки и ходы доски заданного размера, созданные один раз.
+
+    points[i] и moves[i] - точка и ход с индексом i = (row - 1) * num_cols + (col - 1);
+    кодировщики и агенты берут их отсюда, а не создают в циклах. moves[i] -
+    тот же объект, что возвращает Move.play для этой точки, а его индекс на
+    доске этого размера дает point_index.
+    '''
+
+    def __init__(self, num_rows, num_cols):
+        dim = (num_rows, num_cols)
+        if dim not in point_tables:
+            init_point_table(dim)
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.points = point_tables[dim]
+        self.moves = [Move.play(point) for point in self.points]
+        self.move_of_point = dict(zip(self.points, self.moves))
+        self.pass_move = PASS_MOVE
+        self.resign_move = RESIGN_MOVE
+
+    def point_index(self, point):
+        return (point.row - 1) * self.num_cols + (point.col - 1)
+
+
+def get_move_table(num_rows, num_cols):
+    dim = (num_rows, num_cols)
+    if dim not in move_tables:
+        move_tables[dim] = MoveTable(num_rows, num_cols)
+    return move_tables[dim]
 
 
 class GameState():
@@ -329,14 +778,83 @@ class GameState():
         self.board = board
         self.next_player = next_player
         self.previous_state = previous
+        # хэш запоминается при создании: после play() доска предыдущего
+        # состояния уже изменена
+        self._board_hash = board.zobrist_hash()
+        # История позиций не копируется в каждое состояние: она восстанавливается
+        # по цепочке previous_state, а фильтр ситуаций (игрок, хэш) всех
+        # предыдущих состояний быстро отсекает ситуации, которых не было.
+        # Фильтр - неизменяемое целое число, поэтому у каждой ветви дерева
+        # поиска он свой, а новое состояние получает его за O(1).
         if previous is None:
-            self.previous_states = frozenset()
+            self._history_filter = 0
         else:
-            self.previous_states = frozenset(
-                previous.previous_states |
-                {(previous.next_player, previous.board.zobrist_hash())})
+            self._history_filter = previous._history_filter | \
+                situation_bits(previous.next_player, previous._board_hash)
         self.last_move = move
 
+    def __getstate__(self):
+        '''Состояние для pickle: доска и плоская история партии.
+
+        Предыдущие состояния передаются без досок, списком (игрок, хэш,
+        последний ход) - этого хватает для правила суперко и конца партии, а
+        рекурсивная цепочка previous_state длинной партии не поместилась бы в
+        предел рекурсии pickle.
+        '''
+        state = self.__dict__.copy()
+        history = []
+        previous = self.previous_state
+        while previous is not None:
+            history.append((previous.next_player, previous._board_hash, previous.last_move))
+            previous = previous.previous_state
+        state['previous_state'] = None
+        state['_history'] = history
+        return state
+
+    def __setstate__(self, state):
+        history = state.pop('_history')
+        self.__dict__.update(state)
+        previous = None
+        for next_player, board_hash, last_move in reversed(history):
+            past = GameState.__new__(GameState)
+            past.board = None
+            past.next_player = next_player
+            past.previous_state = previous
+            past._board_hash = board_hash
+            if previous is None:
+                past._history_filter = 0
+            else:
+                past._history_filter = previous._history_filter | \
+                    situation_bits(previous.next_player, previous._board_hash)
+            past.last_move = last_move
+            previous = past
+        self.previous_state = previous
+
+    @property
+    def previous_states(self):
+        '''Множество ситуаций (игрок, хэш) всех предыдущих состояний партии'''
+        situations = set()
+        state = self.previous_state
+        while state is not None:
+            situations.add((state.next_player, state._board_hash))
+            state = state.previous_state
+        return frozenset(situations)
+
+    def _situation_in_history(self, situation):
+        '''Встречалась ли ситуация (игрок, хэш) в одном из предыдущих состояний'''
+        player, board_hash = situation
+        bits = situation_bits(player, board_hash)
+        if (self._history_filter & bits) != bits:
+            return False
+        # фильтр может ошибаться только в сторону "была", точный ответ дает
+        # цепочка предков
+        state = self.previous_state
+        while state is not None:
+            if state._board_hash == board_hash and state.next_player == player:
+                return True
+            state = state.previous_state
+        return False
+
     def apply_move(self, move):
         '''Возвращает новое игровое состояние после совершения хода'''
         if move.is_play:
@@ -346,11 +864,31 @@ class GameState():
             next_board = self.board
         return GameState(next_board, self.next_player.other, self, move)
 
+    def play(self, move):
+        '''Совершение хода без копирования доски (make/unmake для поиска).
+
+        Доска текущего состояния изменяется на месте и переходит к новому
+        состоянию, поэтому текущее состояние снова можно использовать только
+        после undo() нового состояния.
+        '''
+        if move.is_play:
+            self.board.play(self.next_player, move.point)
+        return GameState(self.board, self.next_player.other, self, move)
+
+    def undo(self):
+        '''Отмена хода, сделанного через play(); возвращает предыдущее состояние'''
+        if self.last_move.is_play:
+            self.board.undo()
+        return self.previous_state
+
     @classmethod
-    def new_game(cls, board_size):
+    def new_game(cls, board_size, board_type='dict'):
+        '''Новая игра; board_type выбирает реализацию доски из BOARD_TYPES'''
         if isinstance(board_size, int):
             board_size = (board_size, board_size)
-        board = Board(*board_size)
+        if board_type not in BOARD_TYPES:
+            raise ValueError('Unsupported board type: {}'.format(board_type))
+        board = BOARD_TYPES[board_type](*board_size)
         return GameState(board, Player.black, None, None)
 
     def is_move_self_capture(self, player, move):
@@ -369,10 +907,20 @@ class GameState():
             return False
         if not self.board.will_capture(player, move.point):
             return False
-        next_board = copy.deepcopy(self.board)
-        next_board.place_stone(player, move.point)
-        next_situation = (player.other, next_board.zobrist_hash())
-        return next_situation in self.previous_states
+        # хэш позиции после хода считается по снимаемым цепочкам, без копии доски
+        next_hash = self.board.hash_after_move(player, move.point)
+        next_situation = (player.other, next_hash)
+        return self._situation_in_history(next_situation)
+
+    def ko_indices(self):
+        '''Индексы точек, ход в которые next_player запрещен правилом Ко.
+
+        Проверяются только захватывающие ходы (маска доски).
+        '''
+        table = get_move_table(self.board.num_rows, self.board.num_cols)
+        return tuple(
+            int(idx) for idx in np.flatnonzero(self.board.capture_mask(self.next_player))
+            if self.does_move_violate_ko(self.next_player, table.moves[idx]))
 
     def is_valid_move(self, move):
         '''Проверка на допустимость хода для данного игрового состояния'''
@@ -391,6 +939,9 @@ class GameState():
             return False
         if self.last_move.is_resign:
             return True
+        if self.previous_state is None:
+            # позиция задана напрямую, без истории
+            return False
         second_last_move = self.previous_state.last_move
         if second_last_move is None:
             return False
@@ -404,17 +955,28 @@ class GameState():
         # если игра уже закончена. Это изменение делает goboard_fast совместимым с goboard_slow и goboard.
         #исправление ошибки https://github.com/maxpumperla/deep_learning_and_the_game_of_go/issues/61 (вот только этот код не вызывается!)
         moves = []
-        for row in range(1, self.board.num_rows + 1):
-            for col in range(1, self.board.num_cols + 1):
-                move = Move.play(Point(row, col))
-                if self.is_valid_move(move):
-                    moves.append(move)
+        if not self.is_over():
+            # маска доски уже исключает занятые точки и самозахват, Ко
+            # проверяется только для захватывающих ходов
+            table = get_move_table(self.board.num_rows, self.board.num_cols)
+            ko = self.ko_indices()
+            indices = self.board.legal_indices(self.next_player).tolist()
+            moves = [table.moves[idx] for idx in indices if idx not in ko]
         # Эти два шага всегда - допустимы.
         moves.append(Move.pass_turn())
         moves.append(Move.resign())
 
         return moves
 
+    def sensible_moves(self):
+        """Допустимые ходы камнем, не заполняющие собственные глаза (без паса и сдачи)"""
+        if self.is_over():
+            return []
+        table = get_move_table(self.board.num_rows, self.board.num_cols)
+        ko = self.ko_indices()
+        indices = self.board.legal_indices(self.next_player, sensible=True).tolist()
+        return [table.moves[idx] for idx in indices if idx not in ko]
+
     def winner(self):
         if not self.is_over():
             return None
@@ -1,8 +1,15 @@
 import math
+import multiprocessing
 import random
 
+import numpy as np
+
 from dlgo import agent
+from dlgo.agent.budget import SearchBudget
+from dlgo.goboard_fast import Move, get_move_table
 from dlgo.gotypes import Player
+from dlgo.mcts.playout import BATCH_BREAK_EVEN, random_playouts
+from dlgo.mcts.transposition import TranspositionTable, position_key
 from dlgo.utils import coords_from_point
 
 def uct_score(parent_rollouts, child_rollouts, win_pct, temperature):
@@ -12,38 +19,183 @@ def uct_score(parent_rollouts, child_rollouts, win_pct, temperature):
     
 
 class MCTSNode(object):
-    '''Структура данных для представления дерева'''
+    '''Структура данных для представления дерева.
+
+    Статистика узла хранится в массивах родителя: child_rollouts[i] и
+    child_wins[player.value, i] относятся к i-му дочернему узлу, поэтому
+    UCT для всех детей считается одним выражением NumPy. Массивы создаются
+    при добавлении первого дочернего узла с запасом на все допустимые ходы.
+    У корня своя статистика - в массивах из одного элемента.
+
+    Ходы узла не проверяются при его создании: большинство узлов
+    посещается один раз и не раскрывается. При первом раскрытии берется
+    список кандидатов из маски допустимых ходов доски (без проверки Ко),
+    а Ко проверяется только для хода, выбранного из кандидатов случайно.
+
+    В режиме RAVE узел хранит статистику AMAF по индексам точек доски:
+    amaf_rollouts[i] - сколько развертываний через узел игрок, который
+    делает ход в узле, первым сходил в точку i (в дереве ниже узла или в
+    случайной партии), amaf_wins[i] - сколько из них он выиграл.
+    child_points[j] - индекс точки j-го дочернего хода (-1 для паса и сдачи).
+
+    С таблицей транспозиций один узел может быть дочерним у нескольких
+    родителей. Тогда статистика в массивах родителя относится к ребру
+    (родитель, ход), child_moves[j] - ход j-го ребра, а parent и move узла -
+    первого родителя, через которого он был создан.
+    '''
     
     def __init__(self, game_state, parent=None, move=None):
         self.game_state = game_state
         self.parent = parent
         self.move = move
-        self.win_counts = {
-            Player.black: 0,
-            Player.white: 0,
-        }
-        self.num_rollouts = 0
+        if parent is None:
+            self._rollouts = np.zeros(1, dtype=np.int64)
+            self._wins = np.zeros((3, 1), dtype=np.int64)
+            self._slot = 0
+        else:
+            self._rollouts = parent.child_rollouts
+            self._wins = parent.child_wins
+            self._slot = len(parent.children)
+        self.child_rollouts = None
+        self.child_wins = None
         self.children = []
-        self.unvisited_moves = game_state.legal_moves()
+        self.child_moves = []
+        #кандидаты в еще не добавленные ходы (None - список еще не построен)
+        #и уже выбранный и проверенный следующий ход
+        self._candidates = None
+        self._next_move = None
+        self.child_points = None
+        self.amaf_rollouts = None
+        self.amaf_wins = None
+
+    @property
+    def num_rollouts(self):
+        return int(self._rollouts[self._slot])
+
+    @num_rollouts.setter
+    def num_rollouts(self, value):
+        self._rollouts[self._slot] = value
+
+    @property
+    def win_counts(self):
+        return {
+            Player.black: int(self._wins[Player.black.value, self._slot]),
+            Player.white: int(self._wins[Player.white.value, self._slot]),
+        }
     
-    def add_random_child(self):
-        '''Обновление узла дерева'''
-        index = random.randint(0, len(self.unvisited_moves) - 1)
-        new_move = self.unvisited_moves.pop(index)
+    @property
+    def unvisited_moves(self):
+        '''Список еще не добавленных допустимых ходов (с полной проверкой)'''
+        self._draw_move()
+        if self._next_move is None:
+            return []
+        game_state = self.game_state
+        return [self._next_move] + [
+            move for move in self._candidates
+            if not game_state.does_move_violate_ko(game_state.next_player, move)]
+
+    def _init_candidates(self):
+        game_state = self.game_state
+        board = game_state.board
+        if game_state.is_over():
+            candidates = []
+        elif hasattr(board, 'legal_indices'):
+            moves = get_move_table(board.num_rows, board.num_cols).moves
+            candidates = [moves[idx] for idx in board.legal_indices(game_state.next_player)]
+            candidates.append(Move.pass_turn())
+            candidates.append(Move.resign())
+        else:
+            candidates = game_state.legal_moves()
+        self._candidates = candidates
+        num_moves = max(len(candidates), 1)
+        self.child_rollouts = np.zeros(num_moves, dtype=np.int64)
+        self.child_wins = np.zeros((3, num_moves), dtype=np.int64)
+        self.child_points = np.full(num_moves, -1, dtype=np.intp)
+
+    def point_index(self, move):
+        '''Индекс точки хода на доске узла (-1 для паса и сдачи)'''
+        if not move.is_play:
+            return -1
+        return (move.point.row - 1) * self.game_state.board.num_cols + move.point.col - 1
+
+    def _draw_move(self):
+        '''Выбор случайного еще не добавленного хода с проверкой Ко'''
+        if self._next_move is not None:
+            return
+        if self._candidates is None:
+            self._init_candidates()
+        candidates = self._candidates
+        game_state = self.game_state
+        while candidates:
+            index = random.randint(0, len(candidates) - 1)
+            move = candidates[index]
+            candidates[index] = candidates[-1]
+            candidates.pop()
+            if not game_state.does_move_violate_ko(game_state.next_player, move):
+                self._next_move = move
+                return
+
+    def add_random_child(self, transpositions=None):
+        '''Обновление узла дерева.
+
+        Если передана таблица транспозиций и позиция после хода в ней есть,
+        дочерним становится уже существующий узел.
+        '''
+        self._draw_move()
+        new_move = self._next_move
+        self._next_move = None
         new_game_state = self.game_state.apply_move(new_move)
-        new_node = MCTSNode(new_game_state, self, new_move)
+        new_node = None
+        if transpositions is not None:
+            key = position_key(new_game_state)
+            new_node = transpositions.get(key)
+        if new_node is None:
+            new_node = MCTSNode(new_game_state, self, new_move)
+            if transpositions is not None:
+                transpositions.put(key, new_node)
+        self.child_points[len(self.children)] = self.point_index(new_move)
         self.children.append(new_node)
+        self.child_moves.append(new_move)
         return new_node
     
-    def record_win(self, winner):
-        self.win_counts[winner] += 1
-        self.num_rollouts += 1
+    def record_win(self, winner, num_wins=1):
+        self._wins[winner.value, self._slot] += num_wins
+        self._rollouts[self._slot] += num_wins
+
+    def record_child_win(self, slot, winner, num_wins=1):
+        '''Учет развертываний через ребро к дочернему узлу номер slot'''
+        self.child_wins[winner.value, slot] += num_wins
+        self.child_rollouts[slot] += num_wins
+
+    def child_winning_frac(self, slot, player):
+        return float(self.child_wins[player.value, slot]) / float(self.child_rollouts[slot])
+
+    def record_amaf(self, first_colors, winners):
+        '''Учет развертываний в AMAF: first_colors - (партии, точки), winners - (партии,)'''
+        player = self.game_state.next_player.value
+        if self.amaf_rollouts is None:
+            num_points = first_colors.shape[1]
+            self.amaf_rollouts = np.zeros(num_points, dtype=np.int64)
+            self.amaf_wins = np.zeros(num_points, dtype=np.int64)
+        played = first_colors == player
+        self.amaf_rollouts += played.sum(axis=0)
+        self.amaf_wins += played[winners == player].sum(axis=0)
+
+    def detach(self):
+        '''Отсоединение от родителя: статистика копируется в собственные массивы'''
+        if self.parent is None:
+            return
+        self._rollouts = self._rollouts[self._slot:self._slot + 1].copy()
+        self._wins = self._wins[:, self._slot:self._slot + 1].copy()
+        self._slot = 0
+        self.parent = None
     
     def can_add_child(self):
         '''Сообщает, предусматривает ли данная позиция допустимые ходы,
         которые еще не были добавлены в дерево.
         '''
-        return len(self.unvisited_moves) > 0
+        self._draw_move()
+        return self._next_move is not None
     
     def is_terminal(self):
         '''Сообщает, заканчивается ли игра в данном узле.'''
@@ -51,72 +203,350 @@ class MCTSNode(object):
     
     def winning_frac(self, player): #он же winning_pct и victory_frac
         '''Возвращает процент выигрышных развертываний для данного игрока.'''
-        return float(self.win_counts[player]) / float(self.num_rollouts)
+        return float(self._wins[player.value, self._slot]) / float(self._rollouts[self._slot])
 
 class MCTSAgent(agent.Agent):
     '''Агент работающий по алгоритму Монте-Карло'''
     
-    def __init__(self, num_rounds, temperature):
+    def __init__(self, num_rounds, temperature, playouts_per_leaf=None, reuse_tree=False,
+                 num_workers=1, move_time_ms=None, early_stop=False,
+                 rave=False, rave_k=1000, transpositions=None):
+        """playouts_per_leaf - сколько случайных партий доигрывать из каждого
+        нового узла; по умолчанию одна. От BATCH_BREAK_EVEN (8) партий они
+        играются пакетом на NumPy (dlgo.mcts.playout), меньшее число - по
+        одной через RandomBot, который на малых пакетах быстрее.
+
+        reuse_tree - продолжать поиск следующего хода с поддерева выбранного
+        хода (и ответа противника), а не строить дерево заново. По умолчанию
+        выключено: с ним выбор хода зависит от прошлых поисков агента, а не
+        только от позиции и числа раундов, поэтому режим включается явно.
+
+        num_workers - при значении больше 1 поиск параллелится по корню:
+        каждый процесс строит свое дерево из num_rounds раундов, а статистика
+        ходов корня суммируется. Деревья остаются в процессах, поэтому
+        reuse_tree в этом режиме не действует. Пул процессов закрывается
+        методом close().
+
+        move_time_ms - время на ход в миллисекундах, проверяется между
+        раундами; num_rounds в этом случае - жесткий предел числа раундов
+        (None - без предела).
+
+        early_stop - остановить поиск, когда ход, лидирующий по числу
+        развертываний, уже не может быть догнан за оставшиеся раунды (см.
+        SearchBudget). В этом режиме и ход выбирается по числу развертываний,
+        а не по проценту выигрышей, чтобы остановка не меняла выбор. Бюджет
+        последнего поиска с числом раундов и сэкономленных раундов хранится
+        в last_budget.
+
+        rave - учитывать статистику AMAF (все ходы как первые): каждое
+        развертывание обновляет в узлах пути счетчики всех ходов, сделанных
+        игроком узла позже, а при выборе ветви процент выигрышей хода
+        смешивается с его процентом AMAF с весом
+        beta = sqrt(rave_k / (3 * n + rave_k)), где n - число развертываний
+        хода; rave_k - число развертываний, при котором веса сравниваются.
+
+        transpositions - таблица транспозиций (dlgo.mcts.transposition):
+        позиция, полученная разными порядками ходов, представлена одним
+        узлом, статистика ребер хранится у каждого родителя отдельно, а
+        обновление идет по пути спуска. Перед каждым поиском в таблице
+        остаются только узлы поддерева нового корня, поэтому таблица
+        принадлежит одному агенту.
+        """
         agent.Agent.__init__(self)
         self.num_rounds = num_rounds
         self.temperature = temperature
+        self.playouts_per_leaf = playouts_per_leaf
+        self.reuse_tree = reuse_tree
+        self.num_workers = num_workers
+        self.move_time_ms = move_time_ms
+        self.early_stop = early_stop
+        self.last_budget = None
+        self.rave = rave
+        self.rave_k = rave_k
+        self.transpositions = transpositions
+        #узел выбранного на прошлом ходу хода
+        self._last_node = None
+        self._pool = None
     
     def select_move(self, game_state):
         '''Выбор лучшей ветви для исследования'''
-        root = MCTSNode(game_state)
-        
-        for i in range(self.num_rounds):
-            node = root
-            while (not node.can_add_child()) and (not node.is_terminal()):
-                node = self.select_child(node)
-            
-            if node.can_add_child():
-                #добавление в дерево нового дочернего узла
-                node = node.add_random_child()
-            
-            #развертывание случайной игры из этого узла
-            winner = self.simulate_random_game(node.game_state)
-            
-            while node is not None:
-                #обновление счета в предыдущих узлах дерева
-                node.record_win(winner)
-                node = node.parent
+        if self.num_workers > 1:
+            return self.select_move_parallel(game_state)
+        root = self.reuse_subtree(game_state)
+        if root is None:
+            root = MCTSNode(game_state)
+        if self.transpositions is not None:
+            self.transpositions.retain(root, lambda node: node.children)
+        self.search(root)
     
-        #выбираем ход после развертываний, выбирается который имеет наибольший процент выигрышей
+        #выбираем ход после развертываний, выбирается который имеет наибольший процент выигрышей;
+        #с early_stop - самый посещаемый, ведь остановка гарантирует только его
         best_move = None
+        best_child = None
         best_pct = -1.0
-        for child in root.children:
-            child_pct = child.winning_frac(game_state.next_player)
+        for slot, child in enumerate(root.children):
+            if self.early_stop:
+                child_pct = root.child_rollouts[slot]
+            else:
+                child_pct = root.child_winning_frac(slot, game_state.next_player)
             if child_pct > best_pct:
                 best_pct = child_pct
-                best_move = child.move
+                best_move = root.child_moves[slot]
+                best_child = child
+        if self.reuse_tree:
+            self._last_node = best_child
         return best_move
 
+    def search(self, root):
+        '''Раунды поиска от узла root в пределах num_rounds и move_time_ms'''
+        root_visits = None
+        if self.early_stop:
+            root_visits = lambda: root.child_rollouts if root.child_rollouts is not None else ()
+        budget = SearchBudget(self.move_time_ms, self.num_rounds, root_visits,
+                              self.playouts_per_leaf or 1)
+        self.last_budget = budget
+        while budget.next_round():
+            path, node = self.select_path(root)
+            
+            #развертывание случайной игры из этого узла
+            winners, first_colors = self.run_playouts(node.game_state)
+            
+            #обновление счета в предыдущих узлах дерева
+            self.backup(path, node, winners, first_colors)
+
+    def select_path(self, root):
+        '''Спуск от корня с добавлением нового узла.
+
+        Возвращает путь - список ребер (узел, номер дочернего узла) - и лист.
+        Если с таблицей транспозиций спуск вернулся в узел, уже лежащий на
+        пути, лист - этот узел.
+        '''
+        path = []
+        on_path = set([root])
+        node = root
+        while (not node.can_add_child()) and (not node.is_terminal()):
+            slot = self.select_slot(node)
+            path.append((node, slot))
+            node = node.children[slot]
+            if node in on_path:
+                return path, node
+            on_path.add(node)
+        
+        if node.can_add_child():
+            #добавление в дерево нового дочернего узла
+            path.append((node, len(node.children)))
+            node = node.add_random_child(self.transpositions)
+        return path, node
+
+    def run_playouts(self, game_state):
+        '''Развертывания из game_state.
+
+        Возвращает массив победителей (значения Player.value) и в режиме RAVE
+        массив (партии, точки) с цветом, первым сходившим в каждую точку
+        (иначе None).
+        '''
+        num_games = self.playouts_per_leaf or 1
+        if num_games >= BATCH_BREAK_EVEN:
+            if self.rave:
+                return random_playouts(game_state, num_games, first_moves=True)
+            return random_playouts(game_state, num_games), None
+        board = game_state.board
+        winners = np.zeros(num_games, dtype=np.int8)
+        first_colors = None
+        if self.rave:
+            first_colors = np.zeros((num_games, board.num_rows * board.num_cols), dtype=np.int8)
+        for game in range(num_games):
+            moves = [] if self.rave else None
+            winners[game] = self.simulate_random_game(game_state, moves).value
+            if not self.rave:
+                continue
+            #в обратном порядке, чтобы остался цвет первого хода в точку
+            for player, move in reversed(moves):
+                if move.is_play:
+                    idx = (move.point.row - 1) * board.num_cols + move.point.col - 1
+                    first_colors[game, idx] = player.value
+        return winners, first_colors
+
+    def backup(self, path, leaf, winners, first_colors=None):
+        '''Обновление счета (и статистики AMAF) по пути спуска path к листу leaf'''
+        num_black = int((winners == Player.black.value).sum())
+        wins = {
+            Player.black: num_black,
+            Player.white: len(winners) - num_black,
+        }
+        root = path[0][0] if path else leaf
+        for winner, num_wins in wins.items():
+            if num_wins:
+                root.record_win(winner, num_wins)
+                for node, slot in path:
+                    node.record_child_win(slot, winner, num_wins)
+        if first_colors is None:
+            return
+        first_colors = first_colors.copy()
+        leaf.record_amaf(first_colors, winners)
+        for node, slot in reversed(path):
+            point = node.child_points[slot]
+            if point >= 0:
+                #ход из узла тоже сделан после него, и раньше всех остальных
+                first_colors[:, point] = node.game_state.next_player.value
+            node.record_amaf(first_colors, winners)
+
+    def select_move_parallel(self, game_state):
+        '''Параллельный по корню поиск в num_workers процессах.
+
+        Процессам передается сама позиция (GameState с доской и историей
+        партии), поэтому поиск идет и из позиций, камни которых поставлены на
+        доску напрямую (например, фора). Бюджеты процессов суммируются в
+        last_budget.
+        '''
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.num_workers)
+        seeds = [random.randrange(2 ** 31) for _ in range(self.num_workers)]
+        #таблица транспозиций в каждом процессе своя, того же размера
+        table_size = None
+        if self.transpositions is not None:
+            table_size = self.transpositions.max_entries
+        tasks = [
+            (game_state, self.num_rounds, self.temperature, self.playouts_per_leaf,
+             self.move_time_ms, self.early_stop, self.rave, self.rave_k, table_size, seed)
+            for seed in seeds]
+
+        #суммирование статистики ходов корня и бюджетов по всем деревьям
+        max_rounds = None
+        if self.num_rounds is not None:
+            max_rounds = self.num_rounds * self.num_workers
+        budget = SearchBudget(self.move_time_ms, max_rounds)
+        wins = {}
+        rollouts = {}
+        for worker_stats, rounds, rounds_saved in self._pool.map(_search_worker, tasks):
+            budget.rounds += rounds
+            budget.rounds_saved += rounds_saved
+            for move, num_wins, num_rollouts in worker_stats:
+                wins[move] = wins.get(move, 0) + num_wins
+                rollouts[move] = rollouts.get(move, 0) + num_rollouts
+        self.last_budget = budget
+        best_move = None
+        best_pct = -1.0
+        for move, num_rollouts in rollouts.items():
+            if self.early_stop:
+                move_pct = num_rollouts
+            else:
+                move_pct = float(wins[move]) / float(num_rollouts)
+            if move_pct > best_pct:
+                best_pct = move_pct
+                best_move = move
+        return best_move
+
+    def close(self):
+        '''Завершение процессов параллельного поиска'''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # пул процессов и дерево (в том числе узлы в таблице транспозиций)
+        # в другой процесс не передаются
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_last_node'] = None
+        if self.transpositions is not None:
+            state['transpositions'] = TranspositionTable(self.transpositions.max_entries)
+        return state
+
+    def reuse_subtree(self, game_state):
+        '''Поиск узла для game_state в поддереве хода, выбранного в прошлый раз.
+
+        Подходит сам узел выбранного хода (агент играет за обе стороны) или его
+        потомок по ответу противника; позиция сверяется по очереди хода и
+        Zobrist-хэшу. Найденный узел отсоединяется от родителя и становится
+        корнем, остальное дерево освобождается.
+        '''
+        node = self._last_node
+        self._last_node = None
+        if node is None:
+            return None
+        candidates = [node] + [child for child, move in zip(node.children, node.child_moves)
+                               if move == game_state.last_move]
+        for candidate in candidates:
+            state = candidate.game_state
+            if state.next_player == game_state.next_player and \
+                    state.board.zobrist_hash() == game_state.board.zobrist_hash():
+                candidate.detach()
+                return candidate
+        return None
+
     def select_child(self, node):
         '''Выбор ветви для исследования с помощью формулы UCT'''
-        total_rollouts = sum(child.num_rollouts for child in node.children)
-        
-        best_score = -1
-        best_child = None
-        for child in node.children:
-            score = uct_score(
-                total_rollouts,
-                child.num_rollouts,
-                child.winning_frac(node.game_state.next_player),
-                self.temperature)
-            if score > best_score:
-                best_score = score
-                best_child = child
-        return best_child
+        return node.children[self.select_slot(node)]
+
+    def select_slot(self, node):
+        '''Номер дочернего узла с наибольшим значением UCT.
+
+        Та же формула, что в uct_score, но сразу для всех дочерних узлов.
+        '''
+        num_children = len(node.children)
+        rollouts = node.child_rollouts[:num_children]
+        wins = node.child_wins[node.game_state.next_player.value, :num_children]
+        total_rollouts = rollouts.sum()
+        values = wins / rollouts
+        if self.rave and node.amaf_rollouts is not None:
+            points = node.child_points[:num_children]
+            amaf_rollouts = np.where(points >= 0, node.amaf_rollouts[points], 0)
+            amaf_wins = np.where(points >= 0, node.amaf_wins[points], 0)
+            beta = np.sqrt(self.rave_k / (3.0 * rollouts + self.rave_k))
+            beta[amaf_rollouts == 0] = 0.0
+            values = (1 - beta) * values + beta * amaf_wins / np.maximum(amaf_rollouts, 1)
+        scores = values + \
+            self.temperature * np.sqrt(math.log(total_rollouts) / rollouts)
+        return int(scores.argmax())
 
     @staticmethod
-    def simulate_random_game(game):
-        """Симуляция игры как 'bot vs bot'"""
+    def simulate_random_game(game, moves=None):
+        """Симуляция игры как 'bot vs bot'.
+
+        Ходы делаются через play() на доске узла и затем отменяются, так что
+        развертывание не копирует доску на каждом ходу; у состояний без
+        play()/undo() (dlgo.goboard) ходы делаются через apply_move(). Если
+        передан список moves, в него добавляются пары (игрок, ход) сделанных
+        ходов.
+        """
         bots = {
             Player.black: agent.RandomBot(), #.FastRandomBot(),
             Player.white: agent.RandomBot(), #.FastRandomBot(),
         }
-        while not game.is_over():
-            bot_move = bots[game.next_player].select_move(game)
-            game = game.apply_move(bot_move)
-        return game.winner()
\ No newline at end of file
+        start = game
+        undoable = hasattr(game, 'undo')
+        try:
+            while not game.is_over():
+                bot_move = bots[game.next_player].select_move(game)
+                if moves is not None:
+                    moves.append((game.next_player, bot_move))
+                if undoable:
+                    game = game.play(bot_move)
+                else:
+                    game = game.apply_move(bot_move)
+            return game.winner()
+        finally:
+            while undoable and game is not start:
+                game = game.undo()
+
+
+def _search_worker(task):
+    '''Поиск в отдельном процессе: статистика ходов корня (ход, победы,
+    развертывания), число раундов и сэкономленных раундов'''
+    (game_state, num_rounds, temperature, playouts_per_leaf,
+     move_time_ms, early_stop, rave, rave_k, table_size, seed) = task
+    random.seed(seed)
+    np.random.seed(seed)
+    bot = MCTSAgent(num_rounds, temperature, playouts_per_leaf, reuse_tree=False,
+                    move_time_ms=move_time_ms, early_stop=early_stop,
+                    rave=rave, rave_k=rave_k)
+    if table_size is not None:
+        bot.transpositions = TranspositionTable(table_size)
+    root = MCTSNode(game_state)
+    bot.search(root)
+    player = game_state.next_player
+    stats = [(move, int(root.child_wins[player.value, slot]), int(root.child_rollouts[slot]))
+             for slot, move in enumerate(root.child_moves)]
+    return stats, bot.last_budget.rounds, bot.last_budget.rounds_saved
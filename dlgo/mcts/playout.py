@@ -0,0 +1,282 @@
+"""Пакетные случайные развертывания (playouts) на NumPy.
+
+K копий позиции доигрываются одновременно: на каждом шаге все доски делают
+ход одним цветом, маски допустимых ходов и глаз, выбор случайного хода и
+снятие захваченных камней вычисляются для всего пакета сразу, очки по
+площади считает dlgo.scoring.area_scores. Доски хранятся в массиве
+(K, size) с рамкой шириной в одну точку, поэтому соседи точки - это сдвиги
+на +-1 и +-stride.
+
+Правила развертывания совпадают с RandomBot: случайный допустимый ход, не
+заполняющий собственный глаз, иначе пас; партия заканчивается двумя пасами
+подряд. Вместо полной проверки повторения позиций используется простое Ко.
+
+Пакет окупается не сразу: один шаг пакета стоит дороже хода RandomBot, и
+при K = 1 развертывание в 2-3 раза медленнее партии RandomBot (9x9: 20 мс
+против 8 мс, 19x19: 141 мс против 59 мс). Время сравнивается около
+K = BATCH_BREAK_EVEN (8 партий), при K = 32 пакет уже вдвое быстрее.
+"""
+import numpy as np
+
+from dlgo.goboard_fast import Move
+from dlgo.gotypes import Player, Point
+from dlgo.scoring import area_scores
+
+__all__ = [
+    'BATCH_BREAK_EVEN',
+    'random_playouts',
+]
+
+# Число партий, начиная с которого пакет быстрее стольких же партий RandomBot
+BATCH_BREAK_EVEN = 8
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+BORDER = 3
+
+geometries = {}
+
+
+class PlayoutGeometry():
+    '''Индексы и сдвиги для пакета досок заданного размера'''
+
+    def __init__(self, num_rows, num_cols):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.stride = num_cols + 2
+        self.size = (num_rows + 2) * self.stride
+        self.offsets = (-self.stride, self.stride, -1, 1)
+        self.corner_offsets = (-self.stride - 1, -self.stride + 1,
+                               self.stride - 1, self.stride + 1)
+        # все вычисления идут по срезу [lo, hi): в нем есть все точки доски,
+        # а сдвиги на соседей и углы не выходят за пределы массива
+        self.lo = self.stride + 1
+        self.hi = self.size - self.stride - 1
+
+        self.empty_board = np.full(self.size, BORDER, dtype=np.int8)
+        self.index = {}
+        for row in range(1, num_rows + 1):
+            for col in range(1, num_cols + 1):
+                idx = row * self.stride + col
+                self.empty_board[idx] = EMPTY
+                self.index[Point(row=row, col=col)] = idx
+
+
+def get_geometry(num_rows, num_cols):
+    dim = (num_rows, num_cols)
+    if dim not in geometries:
+        geometries[dim] = PlayoutGeometry(num_rows, num_cols)
+    return geometries[dim]
+
+
+def encode_board(board, geometry):
+    '''Доска (любой реализации) в виде массива цветов с рамкой'''
+    colors = geometry.empty_board.copy()
+    for point, idx in geometry.index.items():
+        stone = board.get(point)
+        if stone is not None:
+            colors[idx] = stone.value
+    return colors
+
+
+def label_regions(colors, mask, geometry, labels=None):
+    '''Разметка связных областей одного цвета внутри mask.
+
+    Метка точки - индекс (k * size + idx) точки-корня ее области в пакете,
+    для точек вне mask - k * size для всего пакета (num_boards * size).
+    Соседние области одного цвета подвешиваются к меньшему корню, после чего
+    метки сжимаются переходом к метке метки (pointer jumping), так что число
+    итераций растет как логарифм размера области.
+
+    labels - разметка предыдущего хода: цепочки между ходами только
+    сливаются или снимаются целиком, поэтому с нее достаточно начать заново
+    только вокруг нового камня.
+    '''
+    num_boards, size = colors.shape
+    lo, hi = geometry.lo, geometry.hi
+    outside = num_boards * size
+    cells = np.arange(outside).reshape(num_boards, size)
+    if labels is None:
+        labels = np.where(mask, cells, outside)
+    else:
+        labels = np.where(mask, labels, outside)
+        labels = np.where(mask & (labels == outside), cells, labels)
+    inner_colors = colors[:, lo:hi]
+    inner_mask = mask[:, lo:hi]
+    same = [
+        inner_mask & mask[:, lo + off:hi + off] &
+        (colors[:, lo + off:hi + off] == inner_colors)
+        for off in geometry.offsets]
+    flat = np.empty(outside + 1, dtype=labels.dtype)
+    while True:
+        inner = labels[:, lo:hi]
+        lowest = inner.copy()
+        for off, connected in zip(geometry.offsets, same):
+            np.minimum(lowest, np.where(connected, labels[:, lo + off:hi + off], outside),
+                       out=lowest)
+        changed = lowest < inner
+        if not changed.any():
+            return labels
+        flat[:-1] = labels.ravel()
+        flat[-1] = outside
+        # корень области получает меньшую метку соседа
+        np.minimum.at(flat, inner[changed], lowest[changed])
+        while True:
+            jumped = flat[flat]
+            if np.array_equal(jumped, flat):
+                break
+            flat = jumped
+        labels = flat[:-1].reshape(num_boards, size)
+
+
+def liberty_counts(colors, labels, geometry):
+    '''Количество степеней свободы цепочки в каждой точке с камнем.
+
+    Пустая точка считается один раз для каждой соседней цепочки, даже если
+    касается ее с нескольких сторон.
+    '''
+    num_boards, size = colors.shape
+    lo, hi = geometry.lo, geometry.hi
+    outside = num_boards * size
+    empty = colors[:, lo:hi] == EMPTY
+    counts = np.zeros(outside + 1, dtype=np.intp)
+    seen = []
+    for off in geometry.offsets:
+        neighbor_labels = labels[:, lo + off:hi + off]
+        new = empty & (neighbor_labels != outside)
+        for other in seen:
+            new &= neighbor_labels != other
+        seen.append(neighbor_labels)
+        counts += np.bincount(neighbor_labels[new], minlength=outside + 1)
+    return counts[labels]
+
+
+def candidate_moves(colors, liberties, color, geometry):
+    '''Маска (K, hi - lo) допустимых ходов color, не заполняющих свои глаза'''
+    lo, hi = geometry.lo, geometry.hi
+    other = 3 - color
+    inner = colors[:, lo:hi]
+    has_liberty = np.zeros(inner.shape, dtype=bool)
+    safe = np.zeros(inner.shape, dtype=bool)
+    captures = np.zeros(inner.shape, dtype=bool)
+    all_friendly = np.ones(inner.shape, dtype=bool)
+    for off in geometry.offsets:
+        neighbor = colors[:, lo + off:hi + off]
+        neighbor_libs = liberties[:, lo + off:hi + off]
+        has_liberty |= neighbor == EMPTY
+        safe |= (neighbor == color) & (neighbor_libs > 1)
+        captures |= (neighbor == other) & (neighbor_libs == 1)
+        all_friendly &= (neighbor == color) | (neighbor == BORDER)
+    legal = (inner == EMPTY) & (has_liberty | safe | captures)
+
+    # глаз: как в is_point_an_eye - на краю все углы свои, в середине 3 из 4
+    friendly_corners = np.zeros(inner.shape, dtype=np.int8)
+    off_board_corners = np.zeros(inner.shape, dtype=np.int8)
+    for off in geometry.corner_offsets:
+        corner = colors[:, lo + off:hi + off]
+        friendly_corners += corner == color
+        off_board_corners += corner == BORDER
+    eye = all_friendly & np.where(
+        off_board_corners > 0,
+        off_board_corners + friendly_corners == 4,
+        friendly_corners >= 3)
+    return legal & ~eye
+
+
+def random_playouts(game_state, num_games, komi=7.5, max_moves=None, first_moves=False):
+    '''Доигрывание num_games случайных партий из game_state.
+
+    Возвращает массив победителей длины num_games (значения Player.value).
+    Партии, не закончившиеся за max_moves ходов (по умолчанию - три хода на
+    точку доски), оцениваются по текущей позиции.
+
+    first_moves=True - вернуть еще массив (num_games, num_rows * num_cols)
+    со значением Player.value того, кто первым сходил в точку в этой
+    партии (0 - ходов в точку не было), для статистики AMAF.
+    '''
+    board = game_state.board
+    if game_state.is_over():
+        winners = np.full(num_games, game_state.winner().value, dtype=np.int8)
+        if first_moves:
+            return winners, np.zeros((num_games, board.num_rows * board.num_cols), dtype=np.int8)
+        return winners
+    geometry = get_geometry(board.num_rows, board.num_cols)
+    if max_moves is None:
+        max_moves = 3 * board.num_rows * board.num_cols
+    lo, hi = geometry.lo, geometry.hi
+    rows = np.arange(num_games)
+    colors = np.tile(encode_board(board, geometry), (num_games, 1))
+
+    # Ко на первом ходу берется из истории партии
+    ko = np.full(num_games, -1)
+    for point, idx in geometry.index.items():
+        if board.get(point) is None and \
+                game_state.does_move_violate_ko(game_state.next_player, Move.play(point)):
+            ko[:] = idx
+            break
+    last_move = game_state.last_move
+    passes = np.full(num_games, 1 if last_move is not None and last_move.is_pass else 0)
+    color = game_state.next_player.value
+    labels = None
+    if first_moves:
+        first = np.zeros(colors.shape, dtype=np.int8)
+
+    for _ in range(max_moves):
+        active = passes < 2
+        if not active.any():
+            break
+        other = 3 - color
+        labels = label_regions(colors, (colors == BLACK) | (colors == WHITE),
+                               geometry, labels)
+        liberties = liberty_counts(colors, labels, geometry)
+        candidates = candidate_moves(colors, liberties, color, geometry)
+        candidates[active & (ko >= 0), ko[active & (ko >= 0)] - lo] = False
+        candidates &= active[:, None]
+
+        keys = np.random.random_sample(candidates.shape)
+        keys[~candidates] = -1.0
+        choice = keys.argmax(axis=1)
+        moved = candidates[rows, choice]
+        passes = np.where(moved, 0, np.where(active, passes + 1, passes))
+        ko[:] = -1
+
+        if moved.any():
+            boards = rows[moved]
+            points = choice[moved] + lo
+            colors[boards, points] = color
+            if first_moves:
+                unset = first[boards, points] == 0
+                first[boards[unset], points[unset]] = color
+
+            # снятие цепочек противника, у которых ход занял последнюю свободу
+            dead = np.zeros(num_games * geometry.size + 1, dtype=bool)
+            no_friends = np.ones(len(boards), dtype=bool)
+            for off in geometry.offsets:
+                neighbors = points + off
+                neighbor_colors = colors[boards, neighbors]
+                no_friends &= neighbor_colors != color
+                hit = (neighbor_colors == other) & (liberties[boards, neighbors] == 1)
+                dead[labels[boards[hit], neighbors[hit]]] = True
+            captured = dead[labels] & (colors == other)
+            num_captured = captured.sum(axis=1)
+            colors[captured] = EMPTY
+
+            # простое Ко: снят ровно один камень одиночным камнем, у которого
+            # осталась единственная свобода - точка снятого камня
+            single = (num_captured[boards] == 1) & no_friends
+            if single.any():
+                empty_neighbors = np.zeros(len(boards), dtype=np.int8)
+                for off in geometry.offsets:
+                    empty_neighbors += colors[boards, points + off] == EMPTY
+                is_ko = boards[single & (empty_neighbors == 1)]
+                ko[is_ko] = captured[is_ko].argmax(axis=1)
+        color = other
+
+    inner = colors.reshape(num_games, board.num_rows + 2, geometry.stride)[:, 1:-1, 1:-1]
+    black, white = area_scores(inner)
+    winners = np.where(black > white + komi, Player.black.value, Player.white.value)
+    if first_moves:
+        first = first.reshape(num_games, board.num_rows + 2, geometry.stride)[:, 1:-1, 1:-1]
+        return winners, first.reshape(num_games, -1)
+    return winners
@@ -0,0 +1,118 @@
+"""Таблица транспозиций для поиска по дереву.
+
+Одна и та же позиция может встретиться в дереве после разных порядков
+ходов. Таблица сопоставляет ключу позиции (Zobrist-хэш доски, очередь хода,
+был ли последний ход пасом, закончена ли партия) узел дерева или результат
+оценки, чтобы агенты не создавали и не оценивали позицию заново. Размер
+ограничен: при переполнении вытесняется запись, к которой дольше всего не
+обращались (LRU). Вытеснение только убирает запись из таблицы, узлы в
+дереве остаются.
+
+Таблица узлов относится к одному дереву поиска: при смене корня агент
+вызывает retain, и записи вне поддерева нового корня удаляются. Так таблица
+не возвращает узлы деревьев прошлых ходов и не удерживает их в памяти;
+max_entries ограничивает число записей, а память занимает само дерево.
+
+История позиций (суперко) в ключ не входит: позиции, отличающиеся только
+ею, считаются одинаковыми.
+"""
+import threading
+from collections import OrderedDict
+
+__all__ = [
+    'TranspositionTable',
+    'position_key',
+]
+
+
+def position_key(game_state):
+    '''Ключ позиции для таблицы транспозиций'''
+    last_move = game_state.last_move
+    passed = last_move is not None and last_move.is_pass
+    return (game_state.board.zobrist_hash(), game_state.next_player,
+            passed, game_state.is_over())
+
+
+class TranspositionTable():
+    '''LRU-таблица на max_entries записей со счетчиками попаданий и промахов.
+
+    get и put защищены блокировкой: таблицу можно использовать из
+    нескольких потоков поиска.
+    '''
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''Запись по ключу или None; найденная запись становится самой свежей'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def retain(self, root, children):
+        '''Оставляет только записи с узлами поддерева root.
+
+        children(node) - дочерние узлы узла. Вызывается при смене корня
+        поиска; для нового дерева (root без потомков) таблица очищается.
+        '''
+        reachable = set([id(root)])
+        stack = [root]
+        while stack:
+            for child in children(stack.pop()):
+                if id(child) not in reachable:
+                    reachable.add(id(child))
+                    stack.append(child)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if id(entry) not in reachable]
+            for key in stale:
+                del self._entries[key]
+
+    def __getstate__(self):
+        # блокировка в другой процесс не передается
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stats(self):
+        '''Счетчики таблицы для отчетов'''
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
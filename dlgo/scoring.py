@@ -1,8 +1,19 @@
 from __future__ import absolute_import
 from collections import namedtuple
 
+import numpy as np
+
 from dlgo.gotypes import Player, Point
 
+# Коды статуса точки в массивах территории (territory_status): камни
+# обозначаются значениями Player, как и во входном массиве доски.
+EMPTY = 0
+BLACK_STONE = Player.black.value
+WHITE_STONE = Player.white.value
+BLACK_TERRITORY = 3
+WHITE_TERRITORY = 4
+DAME = 5
+
 
 class Territory:
     def __init__(self, territory_map):  # A `territory_map` splits the board into stones, territory and neutral points (dame).
@@ -25,6 +36,20 @@ class Territory:
                 self.num_dame += 1
                 self.dame_points.append(point)
 
+    @classmethod
+    def from_status(cls, status):
+        """Territory по массиву статусов (num_rows, num_cols) из territory_status."""
+        territory = cls({})
+        territory.num_black_stones = int(np.count_nonzero(status == BLACK_STONE))
+        territory.num_white_stones = int(np.count_nonzero(status == WHITE_STONE))
+        territory.num_black_territory = int(np.count_nonzero(status == BLACK_TERRITORY))
+        territory.num_white_territory = int(np.count_nonzero(status == WHITE_TERRITORY))
+        territory.num_dame = int(np.count_nonzero(status == DAME))
+        territory.dame_points = [
+            Point(row=int(r) + 1, col=int(c) + 1)
+            for r, c in np.argwhere(status == DAME)]
+        return territory
+
 class GameResult(namedtuple('GameResult', 'b w komi')):
     @property
     def winner(self):
@@ -44,6 +69,74 @@ class GameResult(namedtuple('GameResult', 'b w komi')):
         return 'W+%.1f' % (w - self.b,)
 
 
+def board_to_array(board):
+    """Доска в виде массива (num_rows, num_cols): 0 - пусто, иначе Player.value."""
+    stones = np.zeros((board.num_rows, board.num_cols), dtype=np.int8)
+    for r in range(1, board.num_rows + 1):
+        for c in range(1, board.num_cols + 1):
+            stone = board.get(Point(row=r, col=c))
+            if stone is not None:
+                stones[r - 1, c - 1] = stone.value
+    return stones
+
+
+def _neighbors_any(mask):
+    """Точки, у которых хотя бы один сосед по вертикали/горизонтали есть в mask."""
+    out = np.zeros_like(mask)
+    out[..., 1:, :] |= mask[..., :-1, :]
+    out[..., :-1, :] |= mask[..., 1:, :]
+    out[..., :, 1:] |= mask[..., :, :-1]
+    out[..., :, :-1] |= mask[..., :, 1:]
+    return out
+
+
+def _reached_from(stones, color):
+    """Пустые точки, из которых по пустым точкам можно дойти до камня color.
+
+    Пустая область состоит из таких точек целиком или не содержит их вовсе,
+    поэтому заливка от соседей камней заменяет обход областей.
+    """
+    empty = stones == EMPTY
+    reached = empty & _neighbors_any(stones == color)
+    while True:
+        grown = reached | (empty & _neighbors_any(reached))
+        if np.array_equal(grown, reached):
+            return reached
+        reached = grown
+
+
+def territory_status(stones):
+    """territory_status:
+    Map one board (num_rows, num_cols) or a stacked batch
+    (num_boards, num_rows, num_cols) of board arrays into status codes.
+
+    Same rules as evaluate_territory: an empty region bordered by only one
+    color is that color's territory, everything else empty is dame.
+    """
+    stones = np.asarray(stones)
+    reached_black = _reached_from(stones, BLACK_STONE)
+    reached_white = _reached_from(stones, WHITE_STONE)
+    status = stones.astype(np.int8)
+    empty = stones == EMPTY
+    status[empty] = DAME
+    status[reached_black & ~reached_white] = BLACK_TERRITORY
+    status[reached_white & ~reached_black] = WHITE_TERRITORY
+    return status
+
+
+def area_scores(stones):
+    """Очки по площади (камни + территория) черных и белых.
+
+    Для одной доски возвращает пару чисел, для пакета - пару массивов.
+    """
+    status = territory_status(stones)
+    black = np.count_nonzero((status == BLACK_STONE) | (status == BLACK_TERRITORY),
+                             axis=(-2, -1))
+    white = np.count_nonzero((status == WHITE_STONE) | (status == WHITE_TERRITORY),
+                             axis=(-2, -1))
+    return black, white
+
+
 def evaluate_territory(board):
     """ evaluate_territory:
     Map a board into territory and dame.
@@ -52,57 +145,12 @@ def evaluate_territory(board):
     counted as territory; it makes no attempt to identify even
     trivially dead groups.
     """
+    return Territory.from_status(territory_status(board_to_array(board)))
 
-    status = {}
-    for r in range(1, board.num_rows + 1):
-        for c in range(1, board.num_cols + 1):
-            p = Point(row=r, col=c)
-            if p in status:  # Skip the point, if you already visited this as part of a different group.
-                continue
-            stone = board.get(p)
-            if stone is not None:  # If the point is a stone, add it as status.
-                status[p] = board.get(p)
-            else:
-                group, neighbors = _collect_region(p, board)
-                if len(neighbors) == 1:  # If a point is completely surrounded by black or white stones, count it as territory.
-                    neighbor_stone = neighbors.pop()
-                    stone_str = 'b' if neighbor_stone == Player.black else 'w'
-                    fill_with = 'territory_' + stone_str
-                else:
-                    fill_with = 'dame'  # Otherwise the point has to be a neutral point, so we add it to dame.
-                for pos in group:
-                    status[pos] = fill_with
-    return Territory(status)
-
-
-def _collect_region(start_pos, board, visited=None):
-    """ _collect_region:
-
-    Find the contiguous section of a board containing a point. Also
-    identify all the boundary points.
-    """
 
-    if visited is None:
-        visited = {}
-    if start_pos in visited:
-        return [], set()
-    all_points = [start_pos]
-    all_borders = set()
-    visited[start_pos] = True
-    here = board.get(start_pos)
-    deltas = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-    for delta_r, delta_c in deltas:
-        next_p = Point(row=start_pos.row + delta_r, col=start_pos.col + delta_c)
-        if not board.is_on_grid(next_p):
-            continue
-        neighbor = board.get(next_p)
-        if neighbor == here:
-            points, borders = _collect_region(next_p, board, visited)
-            all_points += points
-            all_borders |= borders
-        else:
-            all_borders.add(neighbor)
-    return all_points, all_borders
+def evaluate_territory_batch(stones):
+    """Territory для каждой доски пакета (num_boards, num_rows, num_cols)."""
+    return [Territory.from_status(status) for status in territory_status(stones)]
 
 
 def compute_game_result(game_state):
@@ -111,3 +159,9 @@ def compute_game_result(game_state):
         territory.num_black_territory + territory.num_black_stones,
         territory.num_white_territory + territory.num_white_stones,
         komi=7.5)
+
+
+def compute_game_results(stones, komi=7.5):
+    """GameResult для каждой доски пакета (num_boards, num_rows, num_cols)."""
+    black, white = area_scores(stones)
+    return [GameResult(int(b), int(w), komi=komi) for b, w in zip(black, white)]
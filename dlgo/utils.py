@@ -43,17 +43,69 @@ def coords_from_point(point):
 # Эта функция будет реализована только в 'goboard_fast.py' (goboard.py) чтобы не вводить
 # читателей в заблуждение в первых главах.
 class MoveAge():
+    """Возраст камней: сколько камней было поставлено после данного.
+
+    Хранится не сам возраст, а номер, под которым камень был поставлен на
+    доску; возраст вычисляется при обращении. Поэтому ход меняет одну ячейку,
+    а не увеличивает возраст всех камней, и его легко отменить.
+    """
     def __init__(self, board):
-        self.move_ages = - np.ones((board.num_rows, board.num_cols))
+        # номер хода каждого камня, -1 для пустой точки
+        self.move_numbers = - np.ones((board.num_rows, board.num_cols), dtype=np.int64)
+        # сколько камней поставлено на доску
+        self.num_moves = 0
 
     def get(self, row, col):
-        return self.move_ages[row, col]
+        """Возраст камня в (row, col) (индексы с нуля) или -1 для пустой точки"""
+        move_number = self.move_numbers[row, col]
+        if move_number < 0:
+            return -1
+        return int(self.num_moves - 1 - move_number)
+
+    def ages(self):
+        """Массив возрастов всей доски (-1 для пустых точек)"""
+        return np.where(self.move_numbers < 0, -1, self.num_moves - 1 - self.move_numbers)
 
     def reset_age(self, point):
-        self.move_ages[point.row - 1, point.col - 1] = -1
+        """Снимает камень; возвращает его номер хода (для отмены хода)"""
+        move_number = self.move_numbers[point.row - 1, point.col - 1]
+        self.move_numbers[point.row - 1, point.col - 1] = -1
+        return move_number
+
+    def restore(self, point, move_number):
+        """Возвращает камень, снятый reset_age"""
+        self.move_numbers[point.row - 1, point.col - 1] = move_number
 
     def add(self, point):
-        self.move_ages[point.row - 1, point.col - 1] = 0
+        self.move_numbers[point.row - 1, point.col - 1] = self.num_moves
+        self.num_moves += 1
+
+    def remove_last(self, point):
+        """Обратная операция к add при отмене хода"""
+        self.move_numbers[point.row - 1, point.col - 1] = -1
+        self.num_moves -= 1
+
+    def copy(self):
+        copied = MoveAge.__new__(MoveAge)
+        copied.move_numbers = self.move_numbers.copy()
+        copied.num_moves = self.num_moves
+        return copied
+
+
+class UndoRecord():
+    """Запись стека отмены хода (Board.play / Board.undo).
 
-    def increment_all(self):
-        self.move_ages[self.move_ages > -1] += 1
\ No newline at end of file
+    Хранит точку хода, хэш доски до хода (дельта хэша - это XOR с текущим
+    значением), снятые камни вместе с их номерами хода (MoveAge), точки, в
+    которых ход сделал маски ходов устаревшими, и прежние версии цепочек,
+    замененных ходом. dirty равно None, если доска не отслеживала маски
+    ходов. У первого хода стека masks - маски доски до хода (пара маски,
+    устаревшие точки), иначе None.
+    """
+    def __init__(self, point, board_hash):
+        self.point = point
+        self.board_hash = board_hash
+        self.captured = []
+        self.dirty = None
+        self.replaced_strings = []
+        self.masks = None
\ No newline at end of file
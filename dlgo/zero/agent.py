@@ -1,39 +1,55 @@
+import threading
+
 import numpy as np
 from keras.optimizers import SGD
 
 from ..agent import Agent
+from ..agent.budget import SearchBudget
+from ..mcts.transposition import position_key
 
 __all__ = [
     'ZeroAgent',
 ]
 
+#виртуальное поражение: сколько проигранных посещений добавляется ветвям
+#пути, пока поток ждет оценки листа
+VIRTUAL_LOSS = 1
 
-class Branch:
-    def __init__(self, prior):
-        """Структура для отслеживания статистики ветви."""
-        self.prior = prior #предварительный|предыдущий
-        self.visit_count = 0 #количество посещений ветви
-        self.total_value = 0.0 #общее значение
 
 class ZeroTreeNode:
-    """Узел дерева поиска в стиле AlphaGo Zero (AGZ)."""
-    def __init__(self, state, value, priors, parent, last_move):
+    """Узел дерева поиска в стиле AlphaGo Zero (AGZ).
+
+    Статистика ветвей хранится в выровненных массивах NumPy: i-й элемент
+    priors, visit_counts и total_values относится к ходу branch_moves[i],
+    индекс этого хода в векторе сети - move_indices[i]. priors - вектор
+    априорных вероятностей, индексированный кодировщиком encoder.
+    """
+    def __init__(self, state, value, priors, parent, last_move, encoder):
         self.state = state
         self.value = value
         #в корне дерева параметры parent и last_move будут иметь значение None
         self.parent = parent
         self.last_move = last_move
         self.total_visit_count = 1
-        self.branches = {}
-        for move, p in priors.items():
-            if state.is_valid_move(move):
-                self.branches[move] = Branch(p)
+        legal = [] if state.is_over() else state.legal_moves()
+        #выход из игры сеть не оценивает
+        self.branch_moves = [move for move in legal if not move.is_resign]
+        self.move_indices = np.array(
+            [encoder.encode_move(move) for move in self.branch_moves], dtype=np.int64)
+        self._branch_index = {move: i for i, move in enumerate(self.branch_moves)}
+        self.priors = np.asarray(priors, dtype=np.float64)[self.move_indices]
+        self.visit_counts = np.zeros(len(self.branch_moves), dtype=np.int64)
+        self.total_values = np.zeros(len(self.branch_moves))
+        #виртуальные посещения незаконченных раундов, входящие в visit_counts
+        self.virtual_visits = np.zeros(len(self.branch_moves), dtype=np.int64)
+        #вход сети для позиции узла, если агент его сохранил (см. ZeroAgent.keeps_tensor)
+        self.state_tensor = None
         #позднее дочерние элементы будут отображены из move в другой ZeroTreeNode
         self.children = {}
 
     def moves(self):
         """Возвращает список всех возможных ходов из данного узла."""
-        return self.branches.keys()
+        return self.branch_moves
 
     def add_child(self, move, child_node):
         """Позволяет добавить в дерево новые узлы."""
@@ -48,27 +64,105 @@ class ZeroTreeNode:
         return self.children[move]
 
     def record_visit(self, move, value):
+        i = self._branch_index[move]
         self.total_visit_count += 1
-        self.branches[move].visit_count += 1
-        self.branches[move].total_value += value
+        self.visit_counts[i] += 1
+        self.total_values[i] += value
+
+    def add_virtual_loss(self, move):
+        """Временное проигранное посещение ветви, пока поток оценивает лист."""
+        i = self._branch_index[move]
+        self.total_visit_count += VIRTUAL_LOSS
+        self.visit_counts[i] += VIRTUAL_LOSS
+        self.virtual_visits[i] += VIRTUAL_LOSS
+        self.total_values[i] -= VIRTUAL_LOSS
+
+    def remove_virtual_loss(self, move):
+        i = self._branch_index[move]
+        self.total_visit_count -= VIRTUAL_LOSS
+        self.visit_counts[i] -= VIRTUAL_LOSS
+        self.virtual_visits[i] -= VIRTUAL_LOSS
+        self.total_values[i] += VIRTUAL_LOSS
+
+    def real_visit_counts(self):
+        """Счетчики посещений ветвей без виртуальных поражений."""
+        return self.visit_counts - self.virtual_visits
 
     def expected_value(self, move):
-        branch = self.branches[move]
-        if branch.visit_count == 0:
+        i = self._branch_index[move]
+        if self.visit_counts[i] == 0:
             return 0.0
-        return branch.total_value / branch.visit_count
+        return self.total_values[i] / self.visit_counts[i]
+
+    def expected_values(self):
+        """Средние значения всех ветвей (0 для непосещенных)."""
+        return self.total_values / np.maximum(self.visit_counts, 1)
 
     def prior(self, move):
-        return self.branches[move].prior
+        return self.priors[self._branch_index[move]]
 
     def visit_count(self, move):
-        if move in self.branches:
-            return self.branches[move].visit_count
+        if move in self._branch_index:
+            return int(self.visit_counts[self._branch_index[move]])
         return 0
 
+    def visit_vector(self, num_moves):
+        """Счетчики посещений, разложенные по индексам ходов кодировщика."""
+        visits = np.zeros(num_moves, dtype=self.visit_counts.dtype)
+        visits[self.move_indices] = self.visit_counts
+        return visits
+
 
 class ZeroAgent(Agent):
-    def __init__(self, model, encoder, rounds_per_move=1600, c=2.0):
+    def __init__(self, model, encoder, rounds_per_move=1600, c=2.0, num_threads=1,
+                 move_time_ms=None, early_stop=False, transpositions=None, batch_size=1,
+                 evaluation_cache=None, reuse_tree=False):
+        """num_threads - при значении больше 1 раунды выполняют несколько
+        потоков на общем дереве: пока один поток ждет model.predict, другие
+        спускаются по дереву. На путь потока до получения оценки
+        накладывается виртуальное поражение, чтобы потоки расходились по
+        разным ветвям. Модель должна допускать одновременные вызовы predict.
+        При num_threads=1 поиск последовательный.
+
+        move_time_ms - время на ход в миллисекундах, проверяется между
+        раундами; rounds_per_move в этом случае - жесткий предел числа
+        раундов (None - без предела).
+
+        early_stop - остановить поиск, когда самый посещаемый ход корня уже
+        не может быть догнан за оставшиеся раунды (см. SearchBudget). Бюджет
+        последнего поиска с числом раундов и сэкономленных раундов хранится
+        в last_budget.
+
+        transpositions - таблица транспозиций (dlgo.mcts.transposition):
+        позиция, полученная разными порядками ходов, оценивается сетью один
+        раз и представлена одним узлом; статистика ветвей хранится у каждого
+        родителя, а обновление идет по пути спуска. Перед каждым поиском в
+        таблице остаются только узлы поддерева нового корня.
+
+        batch_size - при значении больше 1 за один проход собирается до
+        batch_size листьев (на пути каждого накладывается виртуальное
+        поражение, чтобы листья были разными), все они оцениваются одним
+        вызовом model.predict, после чего раскрываются и обновляются.
+        Несовместим с num_threads > 1.
+
+        evaluation_cache - LRU-таблица (dlgo.mcts.transposition.TranspositionTable)
+        с выходами сети (вектор априорных вероятностей, оценка) по ключу
+        evaluation_key: позиция, уже оцененная в этом поиске, на прошлых ходах
+        или в прошлых партиях, заново не кодируется и не оценивается. Размер
+        ограничен max_entries таблицы (запись - num_moves чисел float32 и
+        оценка); попадания и промахи считает таблица. Шум Дирихле для корня
+        добавляется после чтения из кэша. Кэш можно разделять только между
+        агентами с одной и той же моделью и кодировщиком.
+
+        reuse_tree - начинать поиск следующего хода с поддерева выбранного
+        хода (сам узел хода, если агент играет за обе стороны, или его
+        потомок по ответу противника) вместо нового корня. Статистика
+        поддерева сохраняется, к априорным вероятностям нового корня заново
+        добавляется шум Дирихле. По умолчанию выключено: с ним выбор хода
+        зависит от прошлых поисков агента, поэтому режим включается явно.
+        """
+        if batch_size > 1 and num_threads > 1:
+            raise ValueError("batch_size and num_threads cannot both exceed 1")
         self.model = model
         self.encoder = encoder
 
@@ -76,97 +170,346 @@ class ZeroAgent(Agent):
 
         self.num_rounds = rounds_per_move
         self.c = c
+        self.num_threads = num_threads
+        self.move_time_ms = move_time_ms
+        self.early_stop = early_stop
+        self.last_budget = None
+        self.transpositions = transpositions
+        self.batch_size = batch_size
+        self.evaluation_cache = evaluation_cache
+        self.reuse_tree = reuse_tree
+        #узел выбранного на прошлом ходу хода
+        self._last_node = None
 
     def set_collector(self, collector):
         self.collector = collector
 
     def select_branch(self, node):
-        """Выбор дочерней ветви."""
-        total_n = node.total_visit_count
-
-        def score_branch(move):
-            q = node.expected_value(move)
-            p = node.prior(move)
-            n = node.visit_count(move)
-            return q + self.c * p * np.sqrt(total_n) / (n+1)
-        #node.moves() - это список ходов. При передаче key=score_branch
-        #функция max возвращает ход с наибольшим значением функции score_branch
-        return max(node.moves(), key=score_branch)
+        """Выбор дочерней ветви.
+
+        Оценка PUCT q + c * p * sqrt(N) / (n + 1) считается сразу для всех
+        ветвей узла; при равенстве выбирается первая ветвь.
+        """
+        scores = node.expected_values() + \
+            self.c * node.priors * np.sqrt(node.total_visit_count) / (node.visit_counts + 1)
+        return node.branch_moves[int(np.argmax(scores))]
 
     def select_move(self, game_state):
         """Выбор хода с помощью нейронной сети."""
 
         ## Спуск по дереву поиска:
         #см.ниже реализацию функции create_node
-        root = self.create_node(game_state)
+        root = self.reuse_subtree(game_state)
+        if root is None:
+            root = self.create_node(game_state)
+        if self.transpositions is not None:
+            self.transpositions.retain(root, lambda node: node.children.values())
 
         #это первый этап процесса, который повторяется много раз для
-        #каждого хода. self.num_moves определяет количество повторений
-        #цикла поиска.
-        for i in range(self.num_rounds):
-            node = root
-            next_move = self.select_branch(node)
-            while node.has_child(next_move):
-                #если функция has_child возвращает значение False,
-                #значит, мы достигли концевого узла дерева
-                node = node.get_child(next_move)
-                next_move = self.select_branch(node)
-
-            new_state = node.state.apply_move(next_move)
-            child_node = self.create_node(new_state, parent=node) #child_node = self.create_node(new_state, move=next_move, parent=node)
-
-            move = next_move
-            #на каждом уровне дерева мы переключаем перспективу между двумя
-            #игроками, что требует умножения значения на -1:то, что хорошо для
-            #черных, плохо для белых, и наоборот
-            value = -1 * child_node.value
-            while node is not None:
-                node.record_visit(move, value)
-                move = node.last_move
-                node = node.parent
-                value = -1 * value
+        #каждого хода. self.num_rounds и self.move_time_ms определяют
+        #количество повторений цикла поиска.
+        root_visits = None
+        rounds_in_flight = None
+        if self.early_stop:
+            #незаконченные раунды еще добавят посещения, но пока не засчитаны
+            root_visits = root.real_visit_counts
+            rounds_in_flight = lambda: int(root.virtual_visits.sum()) // VIRTUAL_LOSS
+        budget = SearchBudget(self.move_time_ms, self.num_rounds, root_visits,
+                              rounds_in_flight=rounds_in_flight)
+        self.last_budget = budget
+        if self.num_threads > 1:
+            self.search_threaded(root, budget)
+        elif self.batch_size > 1:
+            self.search_batched(root, budget)
+        else:
+            while budget.next_round():
+                path = self.select_leaf(root)
+                node, next_move = path[-1]
+                if node.has_child(next_move):
+                    #конечная позиция партии: повторно используется ее оценка
+                    child_node = node.get_child(next_move)
+                else:
+                    child_node = self.expand(node, next_move)
+                #на каждом уровне дерева мы переключаем перспективу между двумя
+                #игроками, что требует умножения значения на -1:то, что хорошо для
+                #черных, плохо для белых, и наоборот
+                self.backup(path, -1 * child_node.value)
 
         #передача решения в коллектор данных опыта
         if self.collector is not None:
-            root_state_tensor = self.encoder.encode(game_state)
-            visit_counts = np.array([
-                root.visit_count(self.encoder.decode_move_index(idx))
-                for idx in range(self.encoder.num_moves())
-            ])
+            root_state_tensor = root.state_tensor
+            if root_state_tensor is None:
+                #позиция корня взята из кэша оценок и не кодировалась
+                root_state_tensor = self.encoder.encode(game_state)
+            visit_counts = root.visit_vector(self.encoder.num_moves())
             self.collector.record_decision(root_state_tensor, visit_counts)
 
         #выбор хода с наибольшим количеством посещений
-        return max(root.moves(), key=root.visit_count)
+        best_move = max(root.moves(), key=root.visit_count)
+        if self.reuse_tree and root.has_child(best_move):
+            self._last_node = root.get_child(best_move)
+        return best_move
+
+    def reuse_subtree(self, game_state):
+        """Узел для game_state в поддереве хода, выбранного в прошлый раз.
+
+        Позиция сверяется по очереди хода и Zobrist-хэшу. Найденный узел
+        становится корнем: отсоединяется от родителя и получает новый шум
+        Дирихле, остальное дерево освобождается.
+        """
+        node = self._last_node
+        self._last_node = None
+        if node is None:
+            return None
+        candidates = [node]
+        if game_state.last_move is not None and node.has_child(game_state.last_move):
+            candidates.append(node.get_child(game_state.last_move))
+        for candidate in candidates:
+            state = candidate.state
+            if state.next_player == game_state.next_player and \
+                    state.board.zobrist_hash() == game_state.board.zobrist_hash():
+                candidate.parent = None
+                candidate.last_move = None
+                self.add_root_noise(candidate)
+                return candidate
+        return None
+
+    @staticmethod
+    def add_root_noise(node):
+        """Шум Дирихле к априорным вероятностям ходов корня {гл.14.4}."""
+        if not node.branch_moves:
+            return
+        noise = np.random.dirichlet(0.03 * np.ones(len(node.branch_moves)))
+        node.priors = 0.75 * node.priors + 0.25 * noise
+
+    def select_leaf(self, root):
+        """Спуск по дереву: путь - список пар (узел, ход).
+
+        Последняя пара - узел и ход, дочернего узла для которого еще нет.
+        Конечные позиции партии не раскрываются (в них нет ходов), для них,
+        как и для узла, уже лежащего на пути (с таблицей транспозиций),
+        последним ходом пути остается ход в уже существующий дочерний узел.
+        """
+        node = root
+        next_move = self.select_branch(node)
+        path = [(node, next_move)]
+        on_path = set([root])
+        while node.has_child(next_move):
+            #если функция has_child возвращает значение False,
+            #значит, мы достигли концевого узла дерева
+            child_node = node.get_child(next_move)
+            if not child_node.branch_moves or child_node in on_path:
+                break
+            node = child_node
+            on_path.add(node)
+            next_move = self.select_branch(node)
+            path.append((node, next_move))
+        return path
+
+    def backup(self, path, value, virtual_loss=False):
+        """Обновление статистики ветвей пути от листа к корню."""
+        for node, move in reversed(path):
+            if virtual_loss:
+                node.remove_virtual_loss(move)
+            node.record_visit(move, value)
+            value = -1 * value
+
+    def expand(self, node, move):
+        """Дочерний узел для хода move: из таблицы транспозиций или новый."""
+        new_state = node.state.apply_move(move)
+        key = None
+        if self.transpositions is not None:
+            key = position_key(new_state)
+            child_node = self.transpositions.get(key)
+            if child_node is not None:
+                node.add_child(move, child_node)
+                return child_node
+        child_node = self.create_node(new_state, move=move, parent=node)
+        if key is not None:
+            self.transpositions.put(key, child_node)
+        return child_node
+
+    def search_threaded(self, root, budget):
+        """Раунды поиска от root в num_threads потоках в пределах budget."""
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not budget.next_round():
+                        return
+                self.search_round_threaded(root, lock)
+
+        threads = [threading.Thread(target=worker) for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def search_round_threaded(self, root, lock):
+        """Раунд поиска: спуск и обновление под блокировкой, оценка сетью - вне ее."""
+        with lock:
+            path = self.select_leaf(root)
+            for node, move in path:
+                node.add_virtual_loss(move)
+            node, next_move = path[-1]
+            new_state = None
+            key = None
+            if not node.has_child(next_move):
+                new_state = node.state.apply_move(next_move)
+                if self.transpositions is not None:
+                    key = position_key(new_state)
+                    child_node = self.transpositions.get(key)
+                    if child_node is not None:
+                        node.add_child(next_move, child_node)
+                        new_state = None
+
+        child_node = None
+        if new_state is not None:
+            tensors = [None]
+            evaluation = self.evaluate_batch([new_state], tensors=tensors)[0]
+            child_node = self.new_node(new_state, evaluation, tensors[0], node, next_move)
+
+        with lock:
+            if node.has_child(next_move):
+                #лист уже раскрыт другим потоком (или это конец партии)
+                child_node = node.get_child(next_move)
+            else:
+                node.add_child(next_move, child_node)
+                if key is not None:
+                    self.transpositions.put(key, child_node)
+            self.backup(path, -1 * child_node.value, virtual_loss=True)
+
+    def search_batched(self, root, budget):
+        """Раунды поиска от root пакетами по batch_size листьев."""
+        while True:
+            #сбор листьев: пути, новые позиции (None - оценка не нужна)
+            #и ключи для таблицы транспозиций
+            leaves = []
+            pending = set()
+            while len(leaves) < self.batch_size and budget.next_round():
+                path = self.select_leaf(root)
+                for node, move in path:
+                    node.add_virtual_loss(move)
+                node, next_move = path[-1]
+                new_state = None
+                key = None
+                if not node.has_child(next_move) and (node, next_move) not in pending:
+                    new_state = node.state.apply_move(next_move)
+                    if self.transpositions is not None:
+                        key = position_key(new_state)
+                        child_node = self.transpositions.get(key)
+                        if child_node is not None:
+                            node.add_child(next_move, child_node)
+                            new_state = None
+                    if new_state is not None:
+                        pending.add((node, next_move))
+                leaves.append((path, new_state, key))
+            if not leaves:
+                return
+
+            new_states = [new_state for _, new_state, _ in leaves if new_state is not None]
+            tensors = [None] * len(new_states)
+            evaluations = iter(zip(self.evaluate_batch(new_states, tensors=tensors), tensors))
+            for path, new_state, key in leaves:
+                node, next_move = path[-1]
+                if new_state is not None:
+                    evaluation, tensor = next(evaluations)
+                    child_node = self.new_node(new_state, evaluation, tensor, node, next_move)
+                    node.add_child(next_move, child_node)
+                    if key is not None:
+                        self.transpositions.put(key, child_node)
+                child_node = node.get_child(next_move)
+                self.backup(path, -1 * child_node.value, virtual_loss=True)
+
+    def evaluate(self, game_state, add_noise=False):
+        """Априорные вероятности ходов и оценка позиции от нейронной сети."""
+        return self.evaluate_batch([game_state], add_noise)[0]
+
+    def evaluate_batch(self, game_states, add_noise=False, tensors=None):
+        """Пары (априорные вероятности ходов, оценка) для списка позиций.
+
+        Все позиции оцениваются одним вызовом model.predict. tensors - список
+        длины len(game_states): в него записываются входы сети для позиций,
+        закодированных при этом вызове (для взятых из кэша остается None).
+        """
+        outputs = [None] * len(game_states)
+        keys = [None] * len(game_states)
+        if self.evaluation_cache is not None:
+            for i, game_state in enumerate(game_states):
+                keys[i] = self.evaluation_key(game_state)
+                outputs[i] = self.evaluation_cache.get(keys[i])
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            #функция Keras predict - это функция пакетной обработки, принимающая
+            #массив примеров.
+            model_input = np.array([self.encoder.encode(game_states[i]) for i in missing])
+            priors, values = self.model.predict(model_input)
+            for j, (i, state_priors, state_value) in enumerate(zip(missing, priors, values)):
+                outputs[i] = (np.array(state_priors, dtype=np.float32), state_value[0])
+                if tensors is not None:
+                    tensors[i] = model_input[j]
+                if self.evaluation_cache is not None:
+                    self.evaluation_cache.put(keys[i], outputs[i])
+        evaluations = []
+        for state_priors, state_value in outputs:
+            # Добавить шум Дирихле к корневому узлу (root node) {гл.14.4}.
+            if add_noise:
+                noise = np.random.dirichlet(
+                    0.03 * np.ones_like(state_priors))
+                state_priors = 0.75 * state_priors + 0.25 * noise
+            #вектор априорных вероятностей индексирован кодировщиком;
+            #узел сам выбирает из него допустимые ходы
+            evaluations.append((state_priors, state_value))
+        return evaluations
+
+    @staticmethod
+    def evaluation_key(game_state):
+        """Ключ кэша оценок: все, от чего зависит кодирование позиции.
+
+        ZeroEncoder использует камни на доске, очередь хода и точки,
+        запрещенные правилом Ко.
+        """
+        return (game_state.board.zobrist_hash(), game_state.next_player,
+                game_state.ko_indices())
 
     def create_node(self, game_state, move=None, parent=None):
         """Создание нового узла в дереве поиска."""
-        state_tensor = self.encoder.encode(game_state)
-        #функция Keras predict - это функция пакетной обработки, принимающая
-        #массив примеров. Поэтому мы должны обернуть board_tensor в массив.
-        model_input = np.array([state_tensor])
-        priors, values = self.model.predict(model_input)
-        #функция predict возращает массивы со множеством результатов, из которых
-        #мы извлекаем первый элемент.
-        priors = priors[0]
-        # Добавить шум Дирихле к корневому узлу (root node) {гл.14.4}.
-        if parent is None:
-            noise = np.random.dirichlet(
-                0.03 * np.ones_like(priors))
-            priors = 0.75 * priors + 0.25 * noise
-        value = values[0][0]
-        #распаковка вектора априорных вероятностей в словарь, отображающий
-        #объекты move в соответствующие априорные вероятности
-        move_priors = {
-            self.encoder.decode_move_index(idx): p for idx, p in enumerate(priors)
-        }
-        new_node = ZeroTreeNode(
-            game_state, value,
-            move_priors,
-            parent, move)
+        tensors = [None]
+        evaluation = self.evaluate_batch([game_state], add_noise=parent is None,
+                                         tensors=tensors)[0]
+        new_node = self.new_node(game_state, evaluation, tensors[0], parent, move)
         if parent is not None:
             parent.add_child(move, new_node)
         return new_node
 
+    def new_node(self, game_state, evaluation, tensor, parent, move):
+        """Узел для позиции с оценкой evaluation и входом сети tensor."""
+        move_priors, value = evaluation
+        node = ZeroTreeNode(game_state, value, move_priors, parent, move, self.encoder)
+        if tensor is not None and self.keeps_tensor(parent):
+            #tensor - строка пакета входов сети; копия, чтобы узел не держал
+            #в памяти весь пакет
+            node.state_tensor = tensor.copy()
+        return node
+
+    def keeps_tensor(self, parent):
+        """Сохранять ли вход сети в новом узле с родителем parent.
+
+        Вход нужен только коллектору и только для узлов, которые могут стать
+        корнем поиска: сам корень, ответы на него и ответы на ответы (при
+        повторном использовании дерева). Более глубокие узлы его не хранят.
+        """
+        if self.collector is None:
+            return False
+        depth = 0
+        while parent is not None:
+            depth += 1
+            if depth > 2:
+                return False
+            parent = parent.parent
+        return True
+
     def train(self, experience, learning_rate, batch_size):
         """Обучение комбинированной сети.
 
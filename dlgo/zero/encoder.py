@@ -1,7 +1,7 @@
 import numpy as np
 from dlgo.encoders.base import Encoder
-from dlgo.goboard_fast import Move
-from dlgo.gotypes import Point, Player
+from dlgo.goboard_fast import Move, get_move_table
+from dlgo.gotypes import Player
 
 class ZeroEncoder(Encoder):
     def __init__(self, board_size):
@@ -12,6 +12,8 @@ class ZeroEncoder(Encoder):
         # 9. 1, если противник получит Коми
         # 10. движение было бы незаконно из-за Ко.
         self.num_planes = 11
+        # точки и ходы доски, общие для всех кодировщиков этого размера
+        self.move_table = get_move_table(board_size, board_size)
 
     def encode(self, game_state):
         board_tensor = np.zeros(self.shape())
@@ -22,12 +24,11 @@ class ZeroEncoder(Encoder):
             board_tensor[9] = 1
         for r in range(self.board_size):
             for c in range(self.board_size):
-                p = Point(row=r + 1, col=c + 1)
-                go_string = game_state.board.get_go_string(p)
+                move = self.move_table.moves[r * self.board_size + c]
+                go_string = game_state.board.get_go_string(move.point)
 
                 if go_string is None:
-                    if game_state.does_move_violate_ko(next_player,
-                                                       Move.play(p)):
+                    if game_state.does_move_violate_ko(next_player, move):
                         board_tensor[10][r][c] = 1
                 else:
                     liberty_plane = min(4, go_string.num_liberties) - 1
@@ -51,9 +52,7 @@ class ZeroEncoder(Encoder):
     def decode_move_index(self, index):
         if index == self.board_size * self.board_size:
             return Move.pass_turn()
-        row = index // self.board_size
-        col = index % self.board_size
-        return Move.play(Point(row=row+1, col=col+1))
+        return self.move_table.moves[index]
 
     def num_moves(self):
         return self.board_size * self.board_size + 1
@@ -10,12 +10,15 @@ import argparse
 import numpy as np
 
 from dlgo.encoders import get_encoder_by_name
-#from dlgo import goboard_fast as goboard
-from dlgo import goboard
+# MCTSAgent доигрывает партии через play()/undo() и пакетные развертывания,
+# которые есть только у goboard_fast
+from dlgo import goboard_fast as goboard
+#from dlgo import goboard
 from dlgo.mcts import mcts
 from dlgo.utils import print_board, print_move
 
-def generate_game(board_size, rounds, max_moves, temperature):
+def generate_game(board_size, rounds, max_moves, temperature, playouts_per_leaf=None,
+                  num_workers=1):
     '''Генератор игровых данных методом Монте-Карло'''
     
     #boards - закодированное состояние доски
@@ -30,7 +33,10 @@ def generate_game(board_size, rounds, max_moves, temperature):
     
     #в качестве бота будет агент поиска по дереву методом Монте-Карло
     #с указанием кол.раундов и температуры
-    bot = mcts.MCTSAgent(rounds, temperature)
+    #(при num_workers > 1 - rounds раундов в каждом из процессов);
+    #бот играет за обе стороны и продолжает поиск с дерева прошлого хода
+    bot = mcts.MCTSAgent(rounds, temperature, playouts_per_leaf, reuse_tree=True,
+                         num_workers=num_workers)
     
     num_moves = 0
     while not game.is_over():
@@ -52,6 +58,7 @@ def generate_game(board_size, rounds, max_moves, temperature):
             #цикл повторяется, пока не достигнуто max кол.ходов
             break
     
+    bot.close()
     return np.array(boards), np.array(moves)
 
 def main():
@@ -62,6 +69,12 @@ def main():
     parser.add_argument('--temperature', '-t', type=float, default=0.8)
     parser.add_argument('--max-moves', '-m', type=int, default=60, help='Max moves per game.')
     parser.add_argument('--num-games', '-n', type=int, default=20) #def=10
+    parser.add_argument('--playouts-per-leaf', type=int, default=None,
+                        help='Random playouts per new tree node. From 8 playouts up they run '
+                             'as one NumPy batch; fewer run one by one with RandomBot, '
+                             'which is faster for small batches.')
+    parser.add_argument('--num-workers', '-w', type=int, default=1,
+                        help='Worker processes for root-parallel search; --rounds is per worker.')
     parser.add_argument('--board-out', type=str, default='features.npy') #без type и def
     parser.add_argument('--move-out', type=str, default='labels.npy') #без type и def
 
@@ -72,7 +85,8 @@ def main():
     for i in range(args.num_games):
         print('Generating game %d/%d...' % (i+1, args.num_games))
         #генерирование игровых данных
-        x, y = generate_game(args.board_size, args.rounds, args.max_moves, args.temperature)
+        x, y = generate_game(args.board_size, args.rounds, args.max_moves, args.temperature,
+                             args.playouts_per_leaf, args.num_workers)
         xs.append(x)
         ys.append(y)
     
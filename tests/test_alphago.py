@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+from dlgo.agent.alphago import AlphaGoMCTS
+from dlgo.encoders.alphago import AlphaGoEncoder
+from dlgo.goboard_fast import Board, GameState, Move
+from dlgo.gotypes import Player, Point
+
+
+class FixedPolicy():
+    '''Быстрая политика с заданными вероятностями; запоминает позиции'''
+    def __init__(self, encoder, probabilities):
+        self.encoder = encoder
+        self.probabilities = probabilities
+        self.seen = []
+
+    def predict(self, game_state):
+        self.seen.append(game_state.last_move)
+        return self.probabilities
+
+
+def rollout_agent(policy, rollout_limit):
+    return AlphaGoMCTS(None, policy, None, rollout_limit=rollout_limit)
+
+
+class PolicyRolloutTest(unittest.TestCase):
+    def test_plays_most_probable_legal_move(self):
+        encoder = AlphaGoEncoder((5, 5))
+        game = GameState.new_game(5).apply_move(Move.play(Point(1, 1)))
+        probabilities = np.zeros(encoder.num_points())
+        # (1, 1) занята, но вероятнее всех; из допустимых лучший ход (1, 4)
+        probabilities[encoder.encode_point(Point(1, 1))] = 0.9
+        probabilities[encoder.encode_point(Point(1, 4))] = 0.5
+        probabilities[encoder.encode_point(Point(1, 3))] = 0.1
+        policy = FixedPolicy(encoder, probabilities)
+
+        rollout_agent(policy, rollout_limit=2).policy_rollout(game)
+        self.assertEqual(policy.seen, [Move.play(Point(1, 1)), Move.play(Point(1, 4))])
+        # развертывание отменяет свои ходы
+        self.assertEqual(game.board.get(Point(1, 4)), None)
+
+    def test_stops_without_legal_point_moves(self):
+        # у белых нет допустимых ходов камнем: оба пункта - глаза черных
+        board = Board(3, 3)
+        for row in range(1, 4):
+            for col in range(1, 4):
+                if (row, col) not in ((1, 1), (3, 3)):
+                    board.place_stone(Player.black, Point(row, col))
+        game = GameState(board, Player.white, None, None)
+        encoder = AlphaGoEncoder((3, 3))
+        policy = FixedPolicy(encoder, np.full(encoder.num_points(), 1.0 / 9))
+
+        result = rollout_agent(policy, rollout_limit=5).policy_rollout(game)
+        # партия не закончена - результат 0
+        self.assertEqual(result, 0)
+        self.assertEqual(len(policy.seen), 1)
+
+    def test_rollout_on_states_without_undo(self):
+        from dlgo import goboard
+        encoder = AlphaGoEncoder((5, 5))
+        game = goboard.GameState.new_game(5)
+        probabilities = np.zeros(encoder.num_points())
+        probabilities[encoder.encode_point(Point(3, 3))] = 0.9
+        policy = FixedPolicy(encoder, probabilities)
+
+        rollout_agent(policy, rollout_limit=2).policy_rollout(game)
+        self.assertEqual(policy.seen[1].point, Point(3, 3))
+        self.assertIsNone(game.board.get(Point(3, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import copy
+import random
+import unittest
+
+from dlgo.goboard_fast import BOARD_TYPES, GameState, Move
+from dlgo.gotypes import Player, Point
+
+
+def board_snapshot(board):
+    '''Все наблюдаемое состояние доски'''
+    points = {}
+    for row in range(1, board.num_rows + 1):
+        for col in range(1, board.num_cols + 1):
+            point = Point(row, col)
+            string = board.get_go_string(point)
+            if string is None:
+                points[point] = (None, [
+                    (player, board.is_self_capture(player, point),
+                     board.will_capture(player, point),
+                     board.hash_after_move(player, point))
+                    for player in Player])
+            else:
+                points[point] = (string.color, string.stones, string.liberties,
+                                 string.num_liberties)
+    masks = [(board.legal_mask(player, sensible).tolist(), board.capture_mask(player).tolist())
+             for player in Player for sensible in (False, True)]
+    return (board.zobrist_hash(), points, masks, board.move_ages.ages().tolist())
+
+
+def random_moves(game, rng):
+    '''Случайный ход; каждый десятый - пас, чтобы партии заканчивались'''
+    candidates = [move for move in game.legal_moves() if move.is_play]
+    if not candidates or rng.random() < 0.1:
+        return Move.pass_turn()
+    return rng.choice(candidates)
+
+
+class BoardTypesTest(unittest.TestCase):
+    '''Все реализации доски ведут себя как Board на случайных партиях'''
+
+    def play_random_games(self, board_type, size, games, seed):
+        rng = random.Random(seed)
+        for _ in range(games):
+            reference = GameState.new_game(size)
+            game = GameState.new_game(size, board_type)
+            while not reference.is_over():
+                self.assertEqual(board_snapshot(game.board), board_snapshot(reference.board))
+                self.assertEqual(game.legal_moves(), reference.legal_moves())
+                self.assertEqual(game.sensible_moves(), reference.sensible_moves())
+                move = random_moves(reference, rng)
+                reference = reference.apply_move(move)
+                game = game.apply_move(move)
+            self.assertEqual(game.winner(), reference.winner())
+
+    def test_board_types_match_dict_board(self):
+        for board_type in sorted(BOARD_TYPES):
+            for size in (5, 7, (4, 6)):
+                self.play_random_games(board_type, size, games=3, seed=1)
+
+    def test_copies_are_independent(self):
+        rng = random.Random(2)
+        for board_type in sorted(BOARD_TYPES):
+            game = GameState.new_game(7, board_type)
+            for _ in range(30):
+                game = game.apply_move(random_moves(game, rng))
+            before = board_snapshot(game.board)
+            copied = copy.deepcopy(game.board)
+            copied_game = GameState(copied, game.next_player, game, game.last_move)
+            for _ in range(30):
+                if copied_game.is_over():
+                    break
+                copied_game = copied_game.play(random_moves(copied_game, rng))
+            self.assertEqual(board_snapshot(game.board), before)
+
+    def test_play_undo_restores_every_board_type(self):
+        rng = random.Random(4)
+        for board_type in sorted(BOARD_TYPES):
+            game = GameState.new_game(7, board_type)
+            snapshots = []
+            while not game.is_over():
+                snapshots.append(board_snapshot(game.board))
+                game = game.play(random_moves(game, rng))
+            while snapshots:
+                game = game.undo()
+                self.assertEqual(board_snapshot(game.board), snapshots.pop())
+            self.assertIsInstance(game.board, BOARD_TYPES[board_type])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from dlgo.agent.budget import SearchBudget
+from dlgo.goboard_fast import GameState
+from dlgo.zero.encoder import ZeroEncoder
+from tests.test_zero_agent import RandomModel, RootRecordingAgent
+
+
+class EarlyStopTest(unittest.TestCase):
+    def test_rounds_in_flight_can_still_catch_up(self):
+        budget = SearchBudget(max_rounds=10, root_visits=lambda: [6, 0])
+        budget.rounds = 7
+        self.assertFalse(budget.next_round())
+        self.assertEqual(budget.rounds_saved, 3)
+
+        # три незаконченных раунда могут отдать посещения второму ходу
+        budget = SearchBudget(max_rounds=10, root_visits=lambda: [6, 0],
+                              rounds_in_flight=lambda: 3)
+        budget.rounds = 7
+        self.assertTrue(budget.next_round())
+
+    def test_batched_search_ignores_virtual_visits(self):
+        np.random.seed(0)
+        encoder = ZeroEncoder(5)
+        seen = []
+
+        class RecordingBudget(SearchBudget):
+            def next_round(self):
+                if self.root_visits is not None:
+                    seen.append((self.rounds, np.sum(self.root_visits()), self.rounds_in_flight()))
+                return SearchBudget.next_round(self)
+
+        bot = RootRecordingAgent(RandomModel(encoder.num_moves()), encoder, 40,
+                                 early_stop=True, batch_size=8, reuse_tree=False)
+        with mock.patch('dlgo.zero.agent.SearchBudget', RecordingBudget):
+            bot.select_move(GameState.new_game(5))
+
+        # законченные посещения и незаконченные раунды вместе - все начатые
+        self.assertTrue(seen)
+        for rounds, visits, in_flight in seen:
+            self.assertEqual(visits + in_flight, rounds)
+        self.assertFalse(bot.root.virtual_visits.any())
+        self.assertEqual(bot.root.visit_counts.sum(), bot.last_budget.rounds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import pickle
+import random
+import unittest
+
+from dlgo.goboard_fast import BOARD_TYPES, GameState, Move, get_move_table, situation_bits
+from dlgo.gotypes import Player, Point
+
+
+def play_all(game, moves):
+    for move in moves:
+        game = game.apply_move(move)
+    return game
+
+
+def ko_game():
+    '''Партия 5x5, в которой черные только что взяли камень в Ко на (3, 3)'''
+    moves = [Move.play(Point(r, c)) for r, c in (
+        (2, 2), (2, 3), (3, 1), (3, 2), (4, 2), (4, 3))]
+    moves += [Move.pass_turn(), Move.play(Point(3, 4)), Move.play(Point(3, 3))]
+    return play_all(GameState.new_game(5), moves)
+
+
+class HistoryTest(unittest.TestCase):
+    def test_immediate_ko_recapture_is_illegal(self):
+        game = ko_game()
+        self.assertIsNone(game.board.get(Point(3, 2)))
+        recapture = Move.play(Point(3, 2))
+        self.assertTrue(game.does_move_violate_ko(Player.white, recapture))
+        self.assertFalse(game.is_valid_move(recapture))
+        self.assertNotIn(recapture, game.legal_moves())
+
+    def test_ko_recapture_is_legal_after_exchange(self):
+        game = ko_game()
+        game = play_all(game, [Move.play(Point(5, 5)), Move.play(Point(1, 5))])
+        self.assertTrue(game.is_valid_move(Move.play(Point(3, 2))))
+
+    def test_play_undo_restores_history(self):
+        game = ko_game()
+        before = game._history_filter
+        state = game.play(Move.play(Point(5, 5)))
+        state = state.play(Move.play(Point(3, 2)))
+        self.assertIs(state.undo().undo(), game)
+        self.assertEqual(game._history_filter, before)
+        self.assertFalse(game.is_valid_move(Move.play(Point(3, 2))))
+
+    def test_play_undo_matches_apply_move(self):
+        for board_type in sorted(BOARD_TYPES):
+            rng = random.Random(3)
+            applied = played = GameState.new_game(7, board_type)
+            snapshots = []
+            while not applied.is_over() and len(snapshots) < 120:
+                snapshots.append((played.board.zobrist_hash(), played.previous_states,
+                                  played._history_filter, played.legal_moves()))
+                candidates = applied.legal_moves()
+                move = rng.choice(candidates[:-1]) if rng.random() > 0.05 else Move.pass_turn()
+                applied = applied.apply_move(move)
+                played = played.play(move)
+                self.assertEqual(played.board.zobrist_hash(), applied.board.zobrist_hash())
+                self.assertEqual(played.previous_states, applied.previous_states)
+                self.assertEqual(played._history_filter, applied._history_filter)
+                self.assertEqual(played.legal_moves(), applied.legal_moves())
+            while snapshots:
+                played = played.undo()
+                self.assertEqual((played.board.zobrist_hash(), played.previous_states,
+                                  played._history_filter, played.legal_moves()),
+                                 snapshots.pop())
+
+    def test_search_does_not_grow_history(self):
+        from dlgo.mcts.mcts import MCTSAgent
+
+        moves = [Move.play(Point(r, c)) for r, c in ((3, 3), (5, 5), (5, 3), (3, 5))]
+        game = play_all(GameState.new_game(7), moves)
+        before = game._history_filter
+        MCTSAgent(200, 1.5).select_move(game)
+
+        history = game.previous_states
+        self.assertEqual(len(history), len(moves))
+        expected = 0
+        for player, board_hash in history:
+            expected |= situation_bits(player, board_hash)
+        self.assertEqual(game._history_filter, before)
+        self.assertEqual(game._history_filter, expected)
+
+
+class MoveTableTest(unittest.TestCase):
+    def test_table_moves_are_the_interned_moves(self):
+        for rows, cols in ((5, 5), (9, 9), (4, 6)):
+            table = get_move_table(rows, cols)
+            for idx, move in enumerate(table.moves):
+                self.assertIs(Move.play(Point(move.point.row, move.point.col)), move)
+                self.assertEqual(table.point_index(move.point), idx)
+        # одна точка - один ход при любом размере доски
+        self.assertIs(get_move_table(5, 5).moves[5], get_move_table(9, 9).moves[9])
+
+    def test_pickled_moves_stay_interned(self):
+        for move in (Move.play(Point(2, 3)), Move.pass_turn(), Move.resign()):
+            self.assertIs(pickle.loads(pickle.dumps(move)), move)
+
+
+if __name__ == '__main__':
+    unittest.main()
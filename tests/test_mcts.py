@@ -0,0 +1,140 @@
+import pickle
+import random
+import unittest
+
+import numpy as np
+
+from dlgo.goboard_fast import Board, GameState, Move
+from dlgo.gotypes import Player, Point
+from dlgo.mcts.mcts import MCTSAgent, MCTSNode
+
+
+def preset_game(last_move=None):
+    '''3x3 с расставленными камнями (как фора): у белых один ход, (2, 2), и он выигрывает'''
+    board = Board(3, 3)
+    for row, col, player in ((1, 1, Player.black), (1, 2, Player.white),
+                             (1, 3, Player.white), (2, 1, Player.black),
+                             (2, 3, Player.black), (3, 1, Player.white),
+                             (3, 2, Player.white), (3, 3, Player.black)):
+        board.place_stone(player, Point(row, col))
+    return GameState(board, Player.white, None, last_move)
+
+
+class PickleTest(unittest.TestCase):
+    def test_round_trip_keeps_board_and_history(self):
+        from tests.test_goboard_fast import ko_game
+        game = ko_game()
+        copied = pickle.loads(pickle.dumps(game))
+        self.assertEqual(copied.board.zobrist_hash(), game.board.zobrist_hash())
+        self.assertEqual(copied.previous_states, game.previous_states)
+        self.assertEqual(copied._history_filter, game._history_filter)
+        self.assertEqual(copied.legal_moves(), game.legal_moves())
+        recapture = Move.play(Point(3, 2))
+        self.assertFalse(copied.is_valid_move(recapture))
+
+
+class ParallelSearchTest(unittest.TestCase):
+    def search(self, game, num_workers):
+        random.seed(0)
+        np.random.seed(0)
+        bot = MCTSAgent(60, 1.5, num_workers=num_workers)
+        try:
+            return bot.select_move(game), bot.last_budget
+        finally:
+            bot.close()
+
+    def test_parallel_matches_single_process_on_preset_position(self):
+        game = preset_game()
+        single, _ = self.search(game, 1)
+        parallel, budget = self.search(game, 2)
+        self.assertEqual(single, Move.play(Point(2, 2)))
+        self.assertEqual(parallel, single)
+        self.assertEqual(budget.rounds, 2 * 60)
+
+    def test_root_with_last_move_and_no_history(self):
+        game = preset_game(last_move=Move.play(Point(3, 3)))
+        parallel, _ = self.search(game, 2)
+        self.assertEqual(parallel, Move.play(Point(2, 2)))
+
+
+class FixedStatsAgent(MCTSAgent):
+    '''Вместо поиска корень получает два хода с заданной статистикой'''
+    def search(self, root):
+        for rollouts, wins in ((10, 9), (30, 15)):
+            child = root.add_random_child()
+            root.child_rollouts[child._slot] = rollouts
+            root.child_wins[root.game_state.next_player.value, child._slot] = wins
+        self.root = root
+
+
+class SelectionTest(unittest.TestCase):
+    def test_selects_by_win_fraction(self):
+        bot = FixedStatsAgent(1, 1.5)
+        move = bot.select_move(GameState.new_game(5))
+        self.assertEqual(move, bot.root.child_moves[0])
+
+    def test_early_stop_selects_the_visit_leader(self):
+        # остановка охраняет лидера по развертываниям - его и играем
+        bot = FixedStatsAgent(1, 1.5, early_stop=True)
+        move = bot.select_move(GameState.new_game(5))
+        self.assertEqual(move, bot.root.child_moves[1])
+
+
+def play_child(node):
+    '''Новый дочерний узел по ходу камнем (пас и сдача пропускаются)'''
+    while True:
+        child = node.add_random_child()
+        if child.move.is_play:
+            return child
+
+
+class RaveBackupTest(unittest.TestCase):
+    def test_amaf_is_credited_to_the_player_of_each_node(self):
+        random.seed(0)
+        root = MCTSNode(GameState.new_game(5))
+        black_node = play_child(root)
+        leaf = play_child(black_node)
+        p1 = root.child_points[len(root.children) - 1]
+        p2 = black_node.child_points[len(black_node.children) - 1]
+        a, b = [idx for idx in range(25) if idx not in (p1, p2)][:2]
+
+        # партия 0: черные первыми в a, белые - в b и в p1 (камень дерева
+        # в p1 снят, и белые сходили туда первыми в развертывании);
+        # партия 1: черные первыми в a; выиграли черные и белые
+        first_colors = np.zeros((2, 25), dtype=np.int8)
+        first_colors[:, a] = Player.black.value
+        first_colors[0, b] = Player.white.value
+        first_colors[0, p1] = Player.white.value
+        winners = np.array([Player.black.value, Player.white.value], dtype=np.int8)
+        original = first_colors.copy()
+        path = [(root, len(root.children) - 1), (black_node, len(black_node.children) - 1)]
+        MCTSAgent(1, 1.5, rave=True).backup(path, leaf, winners, first_colors)
+        self.assertTrue((first_colors == original).all())
+
+        def amaf(node):
+            return {idx: (int(node.amaf_rollouts[idx]), int(node.amaf_wins[idx]))
+                    for idx in np.flatnonzero(node.amaf_rollouts)}
+
+        # в листе ходят черные, статистика - из развертываний как есть
+        self.assertEqual(amaf(leaf), {a: (2, 1)})
+        # в black_node ходят белые: ход дерева p2 сделан ими раньше всех,
+        # p1 в партии 0 - их ход после узла
+        self.assertEqual(amaf(black_node), {p1: (1, 0), b: (1, 0), p2: (2, 1)})
+        # в корне ходят черные: ход дерева p1 заменяет белый ход партии 0
+        self.assertEqual(amaf(root), {a: (2, 1), p1: (2, 1)})
+
+
+class GoboardStateTest(unittest.TestCase):
+    def test_search_on_states_without_undo(self):
+        from dlgo import goboard
+        random.seed(0)
+        game = goboard.GameState.new_game(5)
+        game = game.apply_move(goboard.Move.play(Point(3, 3)))
+        move = MCTSAgent(40, 1.5).select_move(game)
+        self.assertTrue(game.is_valid_move(move))
+        # поиск не изменил историю партии
+        self.assertEqual(len(game.previous_state), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import random
+import unittest
+
+import numpy as np
+
+from dlgo.agent.helpers import is_point_an_eye
+from dlgo.goboard_fast import Board, GameState, Move
+from dlgo.gotypes import Player, Point
+from dlgo.mcts.playout import (BLACK, WHITE, candidate_moves, encode_board, get_geometry,
+                               label_regions, liberty_counts, random_playouts)
+
+
+def random_position(size, num_moves, rng):
+    '''Позиция после num_moves случайных ходов (со взятиями)'''
+    game = GameState.new_game(size)
+    for _ in range(num_moves):
+        moves = [move for move in game.legal_moves() if move.is_play]
+        if not moves:
+            break
+        game = game.apply_move(rng.choice(moves))
+    return game
+
+
+def preset_board(size, stones):
+    board = Board(size, size)
+    for row, col, player in stones:
+        board.place_stone(player, Point(row, col))
+    return board
+
+
+def point_at(first, point, size):
+    '''Кто первым сходил в point по массиву first_moves'''
+    return first[:, (point.row - 1) * size + point.col - 1]
+
+
+# ко на доске 5x5: черные берут камень (2, 2) ходом (2, 3)
+KO_STONES = ((1, 2, Player.black), (2, 1, Player.black), (3, 2, Player.black),
+             (1, 3, Player.white), (2, 4, Player.white), (3, 3, Player.white),
+             (2, 2, Player.white))
+
+
+class BoardArraysTest(unittest.TestCase):
+    def test_regions_and_liberties_match_board_strings(self):
+        rng = random.Random(0)
+        geometry = get_geometry(7, 7)
+        games = [random_position(7, rng.randint(10, 80), rng) for _ in range(12)]
+        # все позиции одним пакетом: области не должны переходить между досками
+        colors = np.array([encode_board(game.board, geometry) for game in games])
+        labels = label_regions(colors, (colors == BLACK) | (colors == WHITE), geometry)
+        liberties = liberty_counts(colors, labels, geometry)
+        for k, game in enumerate(games):
+            for point, idx in geometry.index.items():
+                string = game.board.get_go_string(point)
+                if string is None:
+                    continue
+                self.assertEqual(liberties[k, idx], string.num_liberties)
+                for other, other_idx in geometry.index.items():
+                    same_string = other in string.stones
+                    self.assertEqual(labels[k, idx] == labels[k, other_idx], same_string)
+
+    def test_candidates_match_random_bot_rule(self):
+        rng = random.Random(1)
+        geometry = get_geometry(7, 7)
+        for _ in range(12):
+            board = random_position(7, rng.randint(10, 80), rng).board
+            colors = encode_board(board, geometry)[None]
+            labels = label_regions(colors, (colors == BLACK) | (colors == WHITE), geometry)
+            liberties = liberty_counts(colors, labels, geometry)
+            for player in Player:
+                candidates = candidate_moves(colors, liberties, player.value, geometry)
+                for point, idx in geometry.index.items():
+                    # правило RandomBot без Ко: Ко развертывание проверяет отдельно
+                    expected = board.get(point) is None and \
+                        not board.is_self_capture(player, point) and \
+                        not is_point_an_eye(board, point, player)
+                    self.assertEqual(candidates[0, idx - geometry.lo], expected)
+
+    def test_own_eye_is_not_a_candidate(self):
+        board = preset_board(5, ((1, 2, Player.black), (2, 1, Player.black),
+                                 (2, 2, Player.black)))
+        geometry = get_geometry(5, 5)
+        colors = encode_board(board, geometry)[None]
+        labels = label_regions(colors, colors == BLACK, geometry)
+        liberties = liberty_counts(colors, labels, geometry)
+        corner = geometry.index[Point(1, 1)] - geometry.lo
+        self.assertFalse(candidate_moves(colors, liberties, BLACK, geometry)[0, corner])
+        # белым ход в (1, 1) - самоубийство
+        self.assertFalse(candidate_moves(colors, liberties, WHITE, geometry)[0, corner])
+
+
+class RandomPlayoutsTest(unittest.TestCase):
+    def test_capture_removes_stones(self):
+        # единственный ход черных (2, 1) берет белый камень (1, 1): после
+        # него вся доска черная, без взятия у белых было бы очко
+        stones = [(1, 1, Player.white)] + [
+            (row, col, Player.black) for row in range(1, 4) for col in range(1, 4)
+            if (row, col) not in ((1, 1), (2, 1))]
+        game = GameState(preset_board(3, stones), Player.black, None, None)
+        np.random.seed(0)
+        winners = random_playouts(game, 16, komi=8.5, max_moves=1)
+        self.assertTrue((winners == Player.black.value).all())
+
+    def test_immediate_ko_recapture_is_not_played(self):
+        game = GameState(preset_board(5, KO_STONES), Player.black, None, None)
+        np.random.seed(0)
+        _, first = random_playouts(game, 400, max_moves=2, first_moves=True)
+        took_ko = point_at(first, Point(2, 3), 5) == Player.black.value
+        self.assertTrue(took_ko.any())
+        self.assertFalse(point_at(first, Point(2, 2), 5)[took_ko].any())
+
+    def test_ko_from_game_history(self):
+        # те же камни, что KO_STONES, но ходами; последний ход черных берет (2, 2)
+        game = GameState.new_game(5)
+        moves = [(1, 2), (1, 3), (2, 1), (2, 4), (3, 2), (3, 3), (5, 5), (2, 2), (2, 3)]
+        for row, col in moves:
+            game = game.apply_move(Move.play(Point(row, col)))
+        self.assertIsNone(game.board.get(Point(2, 2)))
+        np.random.seed(0)
+        _, first = random_playouts(game, 200, max_moves=1, first_moves=True)
+        self.assertFalse(point_at(first, Point(2, 2), 5).any())
+        self.assertTrue(first.any())
+
+    def test_two_passes_end_the_playout(self):
+        # белым ходить некуда, у черных есть ходы (2, 2), (1, 1), (3, 3)
+        stones = [(row, col, Player.black) for row in range(1, 4) for col in range(1, 4)
+                  if (row, col) not in ((1, 1), (2, 2), (3, 3))]
+        board = preset_board(3, stones)
+        np.random.seed(0)
+        after_pass = GameState(board, Player.white, None, Move.pass_turn())
+        winners, first = random_playouts(after_pass, 16, first_moves=True)
+        # пас белых - второй пас подряд: партия кончается без ходов
+        self.assertFalse(first.any())
+        self.assertTrue((winners == Player.black.value).all())
+
+        fresh = GameState(board, Player.white, None, None)
+        _, first = random_playouts(fresh, 16, first_moves=True)
+        self.assertTrue((first == Player.black.value).any(axis=1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
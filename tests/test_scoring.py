@@ -0,0 +1,136 @@
+import random
+import unittest
+
+import numpy as np
+
+from dlgo.goboard_fast import Board, GameState
+from dlgo.gotypes import Player, Point
+from dlgo.scoring import (GameResult, Territory, area_scores, board_to_array,
+                          compute_game_result, compute_game_results, evaluate_territory,
+                          evaluate_territory_batch)
+
+
+def reference_territory(board):
+    '''Прежний evaluate_territory: обход пустых областей и их границ'''
+    status = {}
+    for r in range(1, board.num_rows + 1):
+        for c in range(1, board.num_cols + 1):
+            start = Point(row=r, col=c)
+            if start in status:
+                continue
+            stone = board.get(start)
+            if stone is not None:
+                status[start] = stone
+                continue
+            region, borders, stack = [], set(), [start]
+            seen = set([start])
+            while stack:
+                point = stack.pop()
+                region.append(point)
+                for neighbor in point.neighbors():
+                    if not board.is_on_grid(neighbor):
+                        continue
+                    color = board.get(neighbor)
+                    if color is None:
+                        if neighbor not in seen:
+                            seen.add(neighbor)
+                            stack.append(neighbor)
+                    else:
+                        borders.add(color)
+            if len(borders) == 1:
+                fill = 'territory_b' if borders.pop() == Player.black else 'territory_w'
+            else:
+                fill = 'dame'
+            for point in region:
+                status[point] = fill
+    return Territory(status)
+
+
+def board_from_rows(rows):
+    '''Доска по строкам: X - черный камень, O - белый, . - пусто'''
+    board = Board(len(rows), len(rows[0]))
+    for r, line in enumerate(rows):
+        for c, char in enumerate(line):
+            if char != '.':
+                player = Player.black if char == 'X' else Player.white
+                board.place_stone(player, Point(row=r + 1, col=c + 1))
+    return board
+
+
+def random_board(rows, cols, rng):
+    '''Случайная расстановка камней: позиции не обязательно из партии'''
+    board = Board(rows, cols)
+    density = rng.choice((0.2, 0.5, 0.8))
+    for r in range(1, rows + 1):
+        for c in range(1, cols + 1):
+            if rng.random() < density:
+                board.place_stone(rng.choice(list(Player)), Point(row=r, col=c))
+    return board
+
+
+def counts(territory):
+    return (territory.num_black_stones, territory.num_white_stones,
+            territory.num_black_territory, territory.num_white_territory,
+            territory.num_dame, sorted(territory.dame_points))
+
+
+class TerritoryTest(unittest.TestCase):
+    def test_seki_liberties_are_dame(self):
+        # обе группы без глаз делят две свободы (1, 3) и (5, 3)
+        board = board_from_rows([
+            'XX.OO',
+            'XXXOO',
+            'XXXOO',
+            'XXXOO',
+            'XX.OO'])
+        territory = evaluate_territory(board)
+        self.assertEqual(counts(territory), (13, 10, 0, 0, 2, [Point(1, 3), Point(5, 3)]))
+        self.assertEqual(counts(territory), counts(reference_territory(board)))
+
+    def test_dame_and_eyes(self):
+        board = board_from_rows([
+            '.X.O.',
+            'XX.OO',
+            'XX.OO',
+            '.X.O.',
+            'XX.OO'])
+        territory = evaluate_territory(board)
+        self.assertEqual(counts(territory)[:5], (8, 8, 2, 2, 5))
+        self.assertEqual(counts(territory), counts(reference_territory(board)))
+        self.assertEqual(counts(evaluate_territory(Board(4, 4))),
+                         (0, 0, 0, 0, 16, sorted(Point(r, c) for r in range(1, 5)
+                                                  for c in range(1, 5))))
+
+    def test_matches_reference_on_random_boards(self):
+        rng = random.Random(0)
+        for rows, cols in ((5, 5), (9, 9), (4, 7)):
+            boards = [random_board(rows, cols, rng) for _ in range(20)]
+            stones = np.array([board_to_array(board) for board in boards])
+            batch = evaluate_territory_batch(stones)
+            black, white = area_scores(stones)
+            results = compute_game_results(stones)
+            for k, board in enumerate(boards):
+                expected = reference_territory(board)
+                self.assertEqual(counts(evaluate_territory(board)), counts(expected))
+                self.assertEqual(counts(batch[k]), counts(expected))
+                area = (expected.num_black_stones + expected.num_black_territory,
+                        expected.num_white_stones + expected.num_white_territory)
+                self.assertEqual((black[k], white[k]), area)
+                self.assertEqual(area_scores(stones[k]), area)
+                self.assertEqual(results[k], GameResult(area[0], area[1], komi=7.5))
+
+    def test_game_result_matches_reference(self):
+        rng = random.Random(1)
+        for _ in range(10):
+            game = GameState.new_game(7)
+            while not game.is_over():
+                moves = [move for move in game.legal_moves() if not move.is_resign]
+                game = game.apply_move(rng.choice(moves))
+            expected = reference_territory(game.board)
+            result = compute_game_result(game)
+            self.assertEqual(result.b, expected.num_black_stones + expected.num_black_territory)
+            self.assertEqual(result.w, expected.num_white_stones + expected.num_white_territory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import random
+import unittest
+
+import numpy as np
+
+from dlgo.goboard_fast import GameState, Move
+from dlgo.gotypes import Point
+from dlgo.mcts.mcts import MCTSAgent
+from dlgo.mcts.transposition import TranspositionTable, position_key
+
+
+class Node():
+    def __init__(self, name, children=()):
+        self.name = name
+        self.children = list(children)
+
+
+def subtree(root):
+    nodes = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) not in nodes:
+            nodes.add(id(node))
+            stack.extend(node.children)
+    return nodes
+
+
+class RetainTest(unittest.TestCase):
+    def test_retain_keeps_only_subtree(self):
+        shared = Node('shared')
+        left = Node('left', [shared])
+        right = Node('right', [shared])
+        root = Node('root', [left, right])
+        table = TranspositionTable()
+        for node in (root, left, right, shared):
+            table.put(node.name, node)
+        # цикл при транспозициях
+        shared.children.append(right)
+
+        table.retain(right, lambda node: node.children)
+        self.assertEqual(sorted(table._entries), ['right', 'shared'])
+        self.assertIsNone(table.get('root'))
+        self.assertIsNone(table.get('left'))
+
+    def test_new_root_clears_table(self):
+        table = TranspositionTable()
+        table.put('old', Node('old'))
+        table.retain(Node('new'), lambda node: node.children)
+        self.assertEqual(len(table), 0)
+
+
+class AgentTableTest(unittest.TestCase):
+    def test_old_move_entries_are_never_returned(self):
+        random.seed(0)
+        np.random.seed(0)
+        table = TranspositionTable()
+        bot = MCTSAgent(150, 1.5, reuse_tree=True, transpositions=table)
+        game = GameState.new_game(5)
+        seen = set()
+        for reply in (Point(1, 1), Point(5, 5), Point(1, 5)):
+            move = bot.select_move(game)
+            root = bot._last_node.parent
+            while root.parent is not None:
+                root = root.parent
+            kept = subtree(root)
+            for key, node in table._entries.items():
+                self.assertIn(id(node), kept)
+                self.assertEqual(key, position_key(node.game_state))
+            # в таблице нет узлов деревьев прошлых ходов
+            self.assertFalse((seen - kept) & set(map(id, table._entries.values())))
+            seen |= kept
+
+            game = game.apply_move(move)
+            reply = Move.play(reply)
+            game = game.apply_move(reply if game.is_valid_move(reply) else Move.pass_turn())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import copy
+import unittest
+
+import numpy as np
+
+from dlgo.goboard_fast import GameState, Move
+from dlgo.gotypes import Point
+from dlgo.mcts.transposition import TranspositionTable
+from dlgo.zero.agent import ZeroAgent
+from dlgo.zero.encoder import ZeroEncoder
+
+
+class RandomModel():
+    '''Модель со случайными вероятностями ходов и оценками'''
+    def __init__(self, num_moves):
+        self.num_moves = num_moves
+
+    def predict(self, model_input):
+        priors = np.random.random((len(model_input), self.num_moves))
+        priors /= priors.sum(axis=1, keepdims=True)
+        values = np.random.uniform(-1, 1, (len(model_input), 1))
+        return priors, values
+
+
+class CountingModel(RandomModel):
+    '''Случайная модель, считающая оцененные позиции'''
+    def __init__(self, num_moves):
+        RandomModel.__init__(self, num_moves)
+        self.evaluated = 0
+
+    def predict(self, model_input):
+        self.evaluated += len(model_input)
+        return RandomModel.predict(self, model_input)
+
+
+class RootRecordingAgent(ZeroAgent):
+    def create_node(self, game_state, move=None, parent=None):
+        node = ZeroAgent.create_node(self, game_state, move=move, parent=parent)
+        if parent is None:
+            self.root = node
+        return node
+
+
+class ExpandTest(unittest.TestCase):
+    def test_children_are_stored_under_their_moves(self):
+        np.random.seed(0)
+        encoder = ZeroEncoder(5)
+        bot = RootRecordingAgent(RandomModel(encoder.num_moves()), encoder, 60,
+                                 reuse_tree=False)
+        game = GameState.new_game(5)
+        bot.select_move(game)
+
+        root = bot.root
+        self.assertTrue(root.children)
+        for move, child in root.children.items():
+            self.assertIn(move, root.branch_moves)
+            self.assertIs(child.parent, root)
+            self.assertEqual(child.last_move, move)
+            self.assertEqual(child.state.board.zobrist_hash(),
+                             game.apply_move(move).board.zobrist_hash())
+        # поиск уходит глубже одного хода
+        self.assertTrue(any(child.children for child in root.children.values()))
+        self.assertEqual(root.visit_counts.sum(), 60)
+
+
+class ReuseTreeTest(unittest.TestCase):
+    def test_promoted_root_keeps_visits_and_gets_new_noise(self):
+        np.random.seed(0)
+        encoder = ZeroEncoder(5)
+        bot = ZeroAgent(RandomModel(encoder.num_moves()), encoder, 30, reuse_tree=True)
+        game = GameState.new_game(5)
+        move = bot.select_move(game)
+        node = bot._last_node
+        priors = node.priors.copy()
+        visits = node.visit_counts.sum()
+
+        # агент играет за обе стороны: корнем становится узел его хода
+        bot.select_move(game.apply_move(move))
+        self.assertIs(bot._last_node.parent, node)
+        self.assertIsNone(node.parent)
+        self.assertEqual(node.visit_counts.sum(), visits + 30)
+        self.assertFalse(np.allclose(node.priors, priors))
+        # шум смешивается с прежними вероятностями в пропорции 3:1
+        self.assertAlmostEqual(node.priors.sum(), 0.75 * priors.sum() + 0.25)
+
+    def test_tree_is_not_reused_by_default(self):
+        np.random.seed(0)
+        encoder = ZeroEncoder(5)
+        bot = ZeroAgent(RandomModel(encoder.num_moves()), encoder, 30)
+        bot.select_move(GameState.new_game(5))
+        self.assertIsNone(bot._last_node)
+
+
+class EvaluationCacheTest(unittest.TestCase):
+    def cached_agent(self):
+        encoder = ZeroEncoder(5)
+        model = CountingModel(encoder.num_moves())
+        return ZeroAgent(model, encoder, evaluation_cache=TranspositionTable()), model
+
+    def test_transposed_move_orders_hit(self):
+        np.random.seed(0)
+        bot, model = self.cached_agent()
+        first, second = GameState.new_game(5), GameState.new_game(5)
+        for a, b in (((1, 1), (2, 2)), ((5, 5), (5, 5)), ((2, 2), (1, 1))):
+            first = first.apply_move(Move.play(Point(*a)))
+            second = second.apply_move(Move.play(Point(*b)))
+        priors, value = bot.evaluate(first)
+        cached_priors, cached_value = bot.evaluate(second)
+        self.assertEqual(model.evaluated, 1)
+        self.assertEqual(bot.evaluation_cache.hits, 1)
+        self.assertTrue(np.array_equal(priors, cached_priors))
+        self.assertEqual(value, cached_value)
+
+    def test_ko_state_is_part_of_the_key(self):
+        from tests.test_goboard_fast import ko_game
+        np.random.seed(0)
+        bot, model = self.cached_agent()
+        game = ko_game()
+        # те же камни и очередь хода, но без истории - взятие в Ко разрешено
+        no_ko = GameState(copy.deepcopy(game.board), game.next_player, None, None)
+        self.assertEqual(no_ko.board.zobrist_hash(), game.board.zobrist_hash())
+        self.assertTrue(game.ko_indices())
+        self.assertFalse(no_ko.ko_indices())
+        bot.evaluate(game)
+        bot.evaluate(no_ko)
+        self.assertEqual(model.evaluated, 2)
+        self.assertEqual(bot.evaluation_cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -82,9 +82,10 @@ model = Model(
 
 #здесь мы используем 10 раундов на ход для ускорения работы демонстрационной
 #версии. В ходе реального обучения потребляется гораздо большее их количество.
-#Система AGZ использовала 1600.
-black_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0)
-white_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0)
+#Система AGZ использовала 1600. Каждый агент продолжает поиск с поддерева
+#своего прошлого хода.
+black_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0, reuse_tree=True)
+white_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0, reuse_tree=True)
 c1 = zero.ZeroExperienceCollector()
 c2 = zero.ZeroExperienceCollector()
 black_agent.set_collector(c1)